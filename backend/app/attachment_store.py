@@ -0,0 +1,320 @@
+"""
+Local attachment store: uploads streamed to disk and deduplicated by content hash.
+
+Uploads are two-phase. ``attachments.create`` records the attachment and returns an
+upload target on this server (``upload_descriptor``, or ``upload_url`` on chatkit
+releases before it), then the client sends the file there. The body is
+written to a temp file ``chunk_size`` bytes at a time while it is hashed, so an
+upload holds one chunk in memory whatever the file size. The finished file becomes
+``blobs/<sha256>``, or is dropped when identical content is already stored.
+
+Reads never load a whole file. Downloads go out as a ``FileResponse`` (sendfile
+where the server supports it), and ``read_text`` decodes text attachments from an
+mmap one chunk at a time, stopping at ``max_chars``.
+
+Attachments belong to the partition of the request that created them; other
+partitions read them as not found. The upload URL carries a one-off token, so the
+upload itself needs no session header.
+"""
+
+from __future__ import annotations
+
+import codecs
+import hashlib
+import hmac
+import logging
+import mmap
+import os
+import secrets
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterable
+
+import chatkit.types
+import orjson
+from chatkit.store import AttachmentStore, NotFoundError
+from chatkit.types import Attachment, AttachmentCreateParams, FileAttachment
+
+from .data_dir import data_path
+from .memory_store import partition_of
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_PATH = "/chatkit/attachments/{attachment_id}/upload"
+
+# Newer chatkit releases describe the upload target with an AttachmentUploadDescriptor;
+# older ones take a bare upload_url.
+_UploadDescriptor: Any = getattr(chatkit.types, "AttachmentUploadDescriptor", None)
+_UPLOAD_FIELD = "upload_descriptor" if _UploadDescriptor is not None else "upload_url"
+
+
+def _upload_target(url: str) -> dict[str, Any]:
+    if _UploadDescriptor is not None:
+        return {_UPLOAD_FIELD: _UploadDescriptor(url=url, method="POST")}
+    return {_UPLOAD_FIELD: url}
+
+
+# Attachments decoded into agent input; anything else is described, not read
+TEXT_MIME_TYPES = frozenset(
+    {
+        "application/json",
+        "application/ld+json",
+        "application/x-ndjson",
+        "application/xml",
+        "application/yaml",
+        "application/csv",
+    }
+)
+
+
+def is_text(mime_type: str) -> bool:
+    mime_type = mime_type.split(";", 1)[0].strip().lower()
+    return mime_type.startswith("text/") or mime_type in TEXT_MIME_TYPES
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class _Record:
+    attachment: FileAttachment
+    partition: str
+    token: str
+    size: int = 0
+    # Content hash once the upload completes
+    sha256: str | None = None
+
+    def dump(self) -> bytes:
+        return orjson.dumps(
+            {
+                "attachment": self.attachment.model_dump(mode="json"),
+                "partition": self.partition,
+                "token": self.token,
+                "size": self.size,
+                "sha256": self.sha256,
+            }
+        )
+
+    @classmethod
+    def load(cls, raw: bytes) -> _Record:
+        data = orjson.loads(raw)
+        return cls(
+            FileAttachment.model_validate(data["attachment"]),
+            data["partition"],
+            data["token"],
+            data["size"],
+            data["sha256"],
+        )
+
+
+class LocalAttachmentStore(AttachmentStore[dict[str, Any]]):
+    """Content-addressed attachment files under ``directory``."""
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = 10 * 1024 * 1024,
+        chunk_size: int = 64 * 1024,
+        base_url: str | None = None,
+    ) -> None:
+        self._blobs = directory / "blobs"
+        self._meta = directory / "meta"
+        self._uploads = directory / "uploads"
+        for path in (self._blobs, self._meta, self._uploads):
+            path.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._chunk_size = chunk_size
+        self._base_url = base_url.rstrip("/") if base_url else None
+        self._records: dict[str, _Record] = {}
+        # Attachments per blob; a blob is removed with its last attachment
+        self._refs: Counter[str] = Counter()
+        self.uploads = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self._restore()
+
+    @classmethod
+    def from_env(cls) -> LocalAttachmentStore:
+        return cls(
+            data_path("ATTACHMENT_DIR", "attachments"),
+            max_bytes=int(os.getenv("ATTACHMENT_MAX_BYTES", str(10 * 1024 * 1024))),
+            chunk_size=int(os.getenv("ATTACHMENT_CHUNK_BYTES", str(64 * 1024))),
+            base_url=os.getenv("ATTACHMENT_BASE_URL"),
+        )
+
+    def _restore(self) -> None:
+        # Interrupted uploads never completed; the client has to retry them anyway.
+        for partial in self._uploads.iterdir():
+            partial.unlink(missing_ok=True)
+        for path in self._meta.glob("*.json"):
+            try:
+                record = _Record.load(path.read_bytes())
+            except Exception as e:
+                logger.warning(f"Skipping unreadable attachment record {path.name}: {e}")
+                continue
+            self._records[record.attachment.id] = record
+            if record.sha256 is not None:
+                self._refs[record.sha256] += 1
+        if self._records:
+            logger.info(f"Restored {len(self._records)} attachment records")
+
+    def _save(self, record: _Record) -> None:
+        path = self._meta / f"{record.attachment.id}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(record.dump())
+        os.replace(tmp, path)
+
+    def _record(self, attachment_id: str, context: dict[str, Any]) -> _Record:
+        record = self._records.get(attachment_id)
+        if record is None or record.partition != partition_of(context):
+            raise NotFoundError(f"Attachment {attachment_id} not found")
+        return record
+
+    def _upload_url(self, attachment_id: str, token: str, context: dict[str, Any]) -> str:
+        base = self._base_url
+        request = context.get("request")
+        if base is None and request is not None:
+            # The page's origin, so the upload goes through the same proxy as /chatkit
+            base = (request.headers.get("origin") or str(request.base_url)).rstrip("/")
+        path = UPLOAD_PATH.format(attachment_id=attachment_id)
+        return f"{base or ''}{path}?token={token}"
+
+    # -- AttachmentStore -----------------------------------------------------
+    async def create_attachment(
+        self, input: AttachmentCreateParams, context: dict[str, Any]
+    ) -> Attachment:
+        if input.size > self._max_bytes:
+            self.rejected += 1
+            raise AttachmentTooLarge(f"{input.name} is larger than {self._max_bytes} bytes")
+        attachment_id = self.generate_attachment_id(input.mime_type, context)
+        token = secrets.token_urlsafe(24)
+        attachment = FileAttachment(
+            id=attachment_id,
+            name=input.name,
+            mime_type=input.mime_type,
+            **_upload_target(self._upload_url(attachment_id, token, context)),
+        )
+        record = _Record(attachment, partition_of(context), token)
+        self._records[attachment_id] = record
+        self._save(record)
+        return attachment
+
+    async def delete_attachment(self, attachment_id: str, context: dict[str, Any]) -> None:
+        record = self._records.get(attachment_id)
+        if record is None:
+            return
+        if record.partition != partition_of(context):
+            raise NotFoundError(f"Attachment {attachment_id} not found")
+        del self._records[attachment_id]
+        (self._meta / f"{attachment_id}.json").unlink(missing_ok=True)
+        if record.sha256 is not None:
+            self._refs[record.sha256] -= 1
+            if self._refs[record.sha256] <= 0:
+                del self._refs[record.sha256]
+                (self._blobs / record.sha256).unlink(missing_ok=True)
+
+    # -- Uploads -------------------------------------------------------------
+    async def ingest(
+        self, attachment_id: str, token: str, chunks: AsyncIterable[bytes]
+    ) -> FileAttachment:
+        """Write an upload body to disk chunk by chunk; returns the completed attachment."""
+        record = self._records.get(attachment_id)
+        if record is None or record.sha256 is not None:
+            raise NotFoundError(f"Attachment {attachment_id} not found")
+        if not hmac.compare_digest(token, record.token):
+            raise NotFoundError(f"Attachment {attachment_id} not found")
+
+        digest = hashlib.sha256()
+        size = 0
+        partial = self._uploads / f"{attachment_id}.{secrets.token_hex(4)}"
+        try:
+            with partial.open("wb") as fh:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self._max_bytes:
+                        self.rejected += 1
+                        raise AttachmentTooLarge(f"Upload exceeds {self._max_bytes} bytes")
+                    digest.update(chunk)
+                    # Page-cache writes of one chunk; cheaper than a thread hop per chunk
+                    fh.write(chunk)
+            # The attachment may have been deleted while its body was arriving
+            if self._records.get(attachment_id) is not record or record.sha256 is not None:
+                raise NotFoundError(f"Attachment {attachment_id} not found")
+            sha256 = digest.hexdigest()
+            blob = self._blobs / sha256
+            if blob.exists():
+                self.deduplicated += 1
+            else:
+                os.replace(partial, blob)
+        finally:
+            partial.unlink(missing_ok=True)
+
+        record.sha256 = sha256
+        record.size = size
+        record.attachment = record.attachment.model_copy(update={_UPLOAD_FIELD: None})
+        self._refs[sha256] += 1
+        self._save(record)
+        self.uploads += 1
+        logger.info(f"Stored attachment {attachment_id} ({size} bytes, blob {sha256[:12]})")
+        return record.attachment
+
+    # -- Reads ---------------------------------------------------------------
+    def load(self, attachment_id: str, context: dict[str, Any]) -> FileAttachment:
+        return self._record(attachment_id, context).attachment.model_copy()
+
+    def update(self, attachment: Attachment, context: dict[str, Any]) -> None:
+        """Keep metadata a Store save changes (name, thread); content is only set by uploads."""
+        record = self._record(attachment.id, context)
+        if not isinstance(attachment, FileAttachment):
+            return
+        if record.sha256 is not None:
+            attachment = attachment.model_copy(update={_UPLOAD_FIELD: None})
+        if attachment != record.attachment:
+            record.attachment = attachment.model_copy()
+            self._save(record)
+
+    def path(self, attachment_id: str, context: dict[str, Any]) -> Path | None:
+        """The stored file, or None while the upload is pending."""
+        record = self._record(attachment_id, context)
+        return self._blobs / record.sha256 if record.sha256 is not None else None
+
+    def read_text(self, attachment_id: str, max_chars: int) -> tuple[str, bool]:
+        """Up to ``max_chars`` of a text attachment, decoded from an mmap a chunk at a time.
+
+        Returns the text and whether the file was cut short. Callers have already
+        checked the partition (the attachment came from ``load``).
+        """
+        record = self._records.get(attachment_id)
+        if record is None or record.sha256 is None:
+            raise NotFoundError(f"Attachment {attachment_id} not found")
+        if record.size == 0:
+            return "", False
+        decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        parts: list[str] = []
+        remaining = max_chars
+        with (self._blobs / record.sha256).open("rb") as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for start in range(0, len(view), self._chunk_size):
+                    end = start + self._chunk_size
+                    text = decoder.decode(view[start:end], final=end >= len(view))
+                    if len(text) >= remaining:
+                        parts.append(text[:remaining])
+                        return "".join(parts), len(text) > remaining or end < len(view)
+                    parts.append(text)
+                    remaining -= len(text)
+        return "".join(parts), False
+
+    def stats(self) -> dict[str, Any]:
+        completed = [r for r in self._records.values() if r.sha256 is not None]
+        return {
+            "attachments": len(self._records),
+            "pending": len(self._records) - len(completed),
+            "blobs": len(self._refs),
+            "bytes_referenced": sum(r.size for r in completed),
+            "uploads": self.uploads,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "max_bytes": self._max_bytes,
+        }
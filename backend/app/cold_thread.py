@@ -0,0 +1,93 @@
+"""
+Compact representation of threads that are not being actively used.
+
+A cold thread keeps its metadata as JSON and its items as one zlib-compressed JSON
+array, behind ``__slots__``; pydantic models are rebuilt only when the thread is
+touched again. Snapshot entries use the same class with blobs that point into the
+memory-mapped snapshot file.
+"""
+
+from __future__ import annotations
+
+import zlib
+from typing import Any, Sequence
+
+import orjson
+from chatkit.types import ThreadItem, ThreadMetadata
+from pydantic import TypeAdapter
+
+_ITEMS = TypeAdapter(list[ThreadItem])
+
+# Partition of threads saved without a session key, including older snapshots.
+DEFAULT_PARTITION = "public"
+
+
+def encode_items(items: Sequence[ThreadItem], level: int) -> bytes:
+    raw = b"[" + b",".join(item.model_dump_json(by_alias=True).encode() for item in items)
+    return zlib.compress(raw + b"]", level)
+
+
+def encode_metadata(thread: ThreadMetadata) -> bytes:
+    return thread.model_dump_json(by_alias=True).encode()
+
+
+class ColdThread:
+    """A thread stored as serialized blobs until it is hydrated."""
+
+    __slots__ = ("thread_id", "created_key", "version", "partition", "_metadata", "_blob")
+
+    def __init__(
+        self,
+        thread_id: str,
+        created_key: float,
+        version: int,
+        metadata: bytes | dict[str, Any],
+        blob: bytes | memoryview,
+        partition: str = DEFAULT_PARTITION,
+    ) -> None:
+        self.thread_id = thread_id
+        self.created_key = created_key
+        self.version = version
+        self.partition = partition
+        self._metadata = metadata
+        self._blob = blob
+
+    @classmethod
+    def freeze(
+        cls,
+        thread: ThreadMetadata,
+        items: Sequence[ThreadItem],
+        created_key: float,
+        version: int,
+        partition: str = DEFAULT_PARTITION,
+        level: int = 6,
+    ) -> ColdThread:
+        return cls(
+            thread.id,
+            created_key,
+            version,
+            encode_metadata(thread),
+            encode_items(items, level),
+            partition,
+        )
+
+    @property
+    def metadata_json(self) -> bytes:
+        if isinstance(self._metadata, bytes):
+            return self._metadata
+        return orjson.dumps(self._metadata)
+
+    @property
+    def blob(self) -> bytes | memoryview:
+        return self._blob
+
+    def metadata(self) -> ThreadMetadata:
+        if isinstance(self._metadata, bytes):
+            return ThreadMetadata.model_validate_json(self._metadata)
+        return ThreadMetadata.model_validate(self._metadata)
+
+    def items(self) -> list[ThreadItem]:
+        return _ITEMS.validate_json(zlib.decompress(self._blob))
+
+    def nbytes(self) -> int:
+        return len(self._blob) + (len(self._metadata) if isinstance(self._metadata, bytes) else 0)
@@ -0,0 +1,20 @@
+"""
+Where the backend keeps state that outlives a request (report jobs, attachments).
+
+``DATA_DIR`` defaults to ``backend/data`` rather than the working directory, so the
+same files are used however the server is started. Point it at a persistent volume
+in deployment; individual paths can still be overridden with their own variables.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+DATA_DIR = Path(os.getenv("DATA_DIR") or Path(__file__).resolve().parent.parent / "data")
+
+
+def data_path(env_var: str, name: str) -> Path:
+    """``env_var`` if set, else ``name`` inside ``DATA_DIR``."""
+    override = os.getenv(env_var)
+    return Path(override) if override else DATA_DIR / name
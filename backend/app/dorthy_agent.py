@@ -2,23 +2,26 @@
 
 from __future__ import annotations
 
+import json
+import logging
 import os
+from enum import StrEnum
 from pathlib import Path
-from typing import Any
+from typing import Any, get_args
 
-from agents import Agent, FileSearchTool, ModelSettings, Runner, RunConfig
+from agents import Agent, AgentOutputSchema, FileSearchTool, ModelBehaviorError, ModelSettings
 from dotenv import load_dotenv
 from openai.types.shared.reasoning import Reasoning
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
 
 # Load environment variables from .env file
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
+logger = logging.getLogger(__name__)
+
 # Get vector store ID from environment
 VECTOR_STORE_ID = os.getenv("VECTOR_STORE_ID", "vs_69127ab0438c81918e2e4d9b45c1e6a8")
-
-# Tool definitions
 file_search = FileSearchTool(vector_store_ids=[VECTOR_STORE_ID])
 
 
@@ -57,105 +60,315 @@ class CompletnessCheckSchema(BaseModel):
     completed_info: bool
 
 
+# Fields that may stay empty while "completed_info" is true.
+OPTIONAL_FIELDS = frozenset(
+    {
+        "contributors_2_employment_type",
+        "contributors_2_tenure_years_band",
+        "contributors_3_employment_type",
+        "contributors_3_tenure_years_band",
+        "contributors_4_employment_type",
+        "contributors_4_tenure_years_band",
+        "contact_permission",
+    }
+)
+
+
+def missing_required_fields(profile: CompletnessCheckSchema) -> list[str]:
+    """Return the required profile fields that are still empty."""
+    return [
+        name
+        for name, value in profile.model_dump(exclude={"completed_info"}).items()
+        if name not in OPTIONAL_FIELDS and not value.strip()
+    ]
+
+
+# -- Compact routing contract ---------------------------------------------------
+# The routing call emits a ProfileDelta: enum-typed, short-named and containing only
+# the fields that changed since the previous turn. expand_profile() merges it into the
+# full CompletnessCheckSchema and derives completed_info locally.
+
+
+class Province(StrEnum):
+    AB = "AB"
+    BC = "BC"
+    MB = "MB"
+    NB = "NB"
+    NL = "NL"
+    NS = "NS"
+    NT = "NT"
+    NU = "NU"
+    ON = "ON"
+    PE = "PE"
+    QC = "QC"
+    SK = "SK"
+    YT = "YT"
+
+
+class YesNo(StrEnum):
+    YES = "yes"
+    NO = "no"
+
+
+class Timeline(StrEnum):
+    WITHIN_6_MONTHS = "0-6 months"
+    WITHIN_12_MONTHS = "6-12 months"
+    WITHIN_2_YEARS = "1-2 years"
+    LATER = "2+ years"
+
+
+class Citizenship(StrEnum):
+    CITIZEN = "Canadian citizen"
+    PERMANENT_RESIDENT = "permanent resident"
+    OTHER = "other"
+
+
+class OwnershipHistory(StrEnum):
+    NEVER_OWNED = "never owned"
+    OWNED_BEFORE = "owned before"
+
+
+class PropertyType(StrEnum):
+    RESALE = "resale"
+    NEW_CONSTRUCTION = "new construction"
+    EITHER = "either"
+
+
+class EmploymentType(StrEnum):
+    FULL_TIME = "full-time"
+    PART_TIME = "part-time"
+    SELF_EMPLOYED = "self-employed"
+    CONTRACT = "contract"
+    OTHER = "other"
+
+
+class TenureBand(StrEnum):
+    UNDER_1 = "under 1 year"
+    FROM_1_TO_3 = "1-3 years"
+    FROM_3_TO_5 = "3-5 years"
+    OVER_5 = "5+ years"
+
+
+class IncomeBand(StrEnum):
+    UNDER_50K = "under $50K"
+    FROM_50K_TO_80K = "$50-80K"
+    FROM_80K_TO_120K = "$80-120K"
+    FROM_120K_TO_200K = "$120-200K"
+    OVER_200K = "over $200K"
+
+
+class CreditBand(StrEnum):
+    BELOW_600 = "below 600"
+    FROM_600_TO_659 = "600-659"
+    FROM_660_TO_724 = "660-724"
+    FROM_725_TO_759 = "725-759"
+    OVER_760 = "760+"
+
+
+class DebtBand(StrEnum):
+    UNDER_10 = "under 10%"
+    FROM_10_TO_30 = "10-30%"
+    FROM_30_TO_50 = "30-50%"
+    OVER_50 = "over 50%"
+
+
+class DownPaymentBand(StrEnum):
+    UNDER_5 = "under 5%"
+    FROM_5_TO_10 = "5-10%"
+    FROM_10_TO_20 = "10-20%"
+    OVER_20 = "over 20%"
+
+
+class ProfileDelta(BaseModel):
+    """Fields set or changed this turn; everything omitted keeps its previous value."""
+
+    province: Province | None = None
+    city: str | None = None
+    timeline: Timeline | None = None
+    home_type: str | None = None
+    bedrooms: str | None = None
+    must_haves: str | None = None
+    pain_points: str | None = None
+    earners: int | None = Field(default=None, ge=1, le=4)
+    c1_job: EmploymentType | None = None
+    c1_tenure: TenureBand | None = None
+    c2_job: EmploymentType | None = None
+    c2_tenure: TenureBand | None = None
+    c3_job: EmploymentType | None = None
+    c3_tenure: TenureBand | None = None
+    c4_job: EmploymentType | None = None
+    c4_tenure: TenureBand | None = None
+    income: IncomeBand | None = None
+    credit: CreditBand | None = None
+    debt: DebtBand | None = None
+    down_payment: DownPaymentBand | None = None
+    age_18_plus: YesNo | None = None
+    citizenship: Citizenship | None = None
+    first_time: OwnershipHistory | None = None
+    spouse_owned: YesNo | None = None
+    property_type: PropertyType | None = None
+    occupy_in_9_months: YesNo | None = None
+    disability: YesNo | None = None
+    prior_ltt_rebate: YesNo | None = None
+    contact_ok: YesNo | None = None
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _drop_invalid(cls, value: Any, info: ValidationInfo) -> Any:
+        """Values outside the schema become None (unknown) instead of failing the turn.
+
+        The schema is not strict, so the model is not held to the enums and bounds.
+        """
+        if value is None or isinstance(value, (dict, list)):
+            return None
+        if info.field_name == "earners":
+            try:
+                earners = int(value)
+            except (TypeError, ValueError):
+                return None
+            # Only four earners are tracked; a bigger household fills all four
+            return min(earners, 4) if earners >= 1 else None
+        enum = _ENUM_FIELDS.get(info.field_name or "")
+        if enum is None:
+            return str(value)
+        text = str(value).strip().lower()
+        if enum is Province:
+            text = _PROVINCE_NAMES.get(text, text)
+        return next((member for member in enum if member.value.lower() == text), None)
+
+
+# ProfileDelta fields typed with an enum
+_ENUM_FIELDS: dict[str, type[StrEnum]] = {
+    name: arg
+    for name, field in ProfileDelta.model_fields.items()
+    for arg in get_args(field.annotation)
+    if isinstance(arg, type) and issubclass(arg, StrEnum)
+}
+
+_PROVINCE_NAMES = {
+    "alberta": "ab",
+    "british columbia": "bc",
+    "manitoba": "mb",
+    "new brunswick": "nb",
+    "newfoundland": "nl",
+    "newfoundland and labrador": "nl",
+    "nova scotia": "ns",
+    "northwest territories": "nt",
+    "nunavut": "nu",
+    "ontario": "on",
+    "prince edward island": "pe",
+    "quebec": "qc",
+    "québec": "qc",
+    "saskatchewan": "sk",
+    "yukon": "yt",
+}
+
+
+class _LenientDeltaSchema(AgentOutputSchema):
+    """ProfileDelta output that degrades to an empty delta when the JSON is unusable.
+
+    An empty delta keeps the previous profile, so a malformed answer costs one turn's
+    updates rather than the turn.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(ProfileDelta, strict_json_schema=False)
+
+    def validate_json(self, json_str: str) -> Any:
+        try:
+            return super().validate_json(json_str)
+        except ModelBehaviorError as e:
+            logger.warning(f"Discarding unparseable profile delta: {e}")
+            return ProfileDelta()
+
+
+# ProfileDelta field -> CompletnessCheckSchema field
+DELTA_FIELDS = {
+    "province": "province",
+    "city": "city_or_region",
+    "timeline": "timeline",
+    "home_type": "daydream_home_type",
+    "bedrooms": "daydream_bedrooms",
+    "must_haves": "daydream_must_haves",
+    "pain_points": "pain_points",
+    "earners": "household_contributors",
+    "c1_job": "contributors_1_employment_type",
+    "c1_tenure": "contributors_1_tenure_years_band",
+    "c2_job": "contributors_2_employment_type",
+    "c2_tenure": "contributors_2_tenure_years_band",
+    "c3_job": "contributors_3_employment_type",
+    "c3_tenure": "contributors_3_tenure_years_band",
+    "c4_job": "contributors_4_employment_type",
+    "c4_tenure": "contributors_4_tenure_years_band",
+    "income": "income_band",
+    "credit": "credit_band",
+    "debt": "monthly_debt_payments_band",
+    "down_payment": "down_payment_band",
+    "age_18_plus": "eligibility_age_18_plus",
+    "citizenship": "eligibility_citizenship_status",
+    "first_time": "eligibility_first_time_status",
+    "spouse_owned": "eligibility_spouse_owned",
+    "property_type": "eligibility_property_type",
+    "occupy_in_9_months": "eligibility_occupancy_plan",
+    "disability": "eligibility_disability_status",
+    "prior_ltt_rebate": "eligibility_prior_LTT_rebate",
+    "contact_ok": "contact_permission",
+}
+
+
+def empty_profile() -> CompletnessCheckSchema:
+    # Most buyers are in Ontario; the extractor changes the province when they are not
+    fields: dict[str, Any] = dict.fromkeys(CompletnessCheckSchema.model_fields, "")
+    return CompletnessCheckSchema.model_validate(
+        {**fields, "province": Province.ON.value, "completed_info": False}
+    )
+
+
+def expand_profile(
+    previous: CompletnessCheckSchema | None, delta: ProfileDelta
+) -> CompletnessCheckSchema:
+    """Apply ``delta`` to ``previous`` and derive ``completed_info`` locally."""
+    values = (previous or empty_profile()).model_dump()
+    for name, value in delta.model_dump(exclude_none=True).items():
+        values[DELTA_FIELDS[name]] = str(value)
+    profile = CompletnessCheckSchema.model_validate(values)
+    profile.completed_info = not missing_required_fields(profile)
+    return profile
+
+
+def compact_profile(profile: CompletnessCheckSchema | None) -> str:
+    """The known profile in ProfileDelta terms, as the routing call's baseline."""
+    if profile is None:
+        return "{}"
+    known = {
+        short: getattr(profile, full)
+        for short, full in DELTA_FIELDS.items()
+        if getattr(profile, full).strip()
+    }
+    return json.dumps(known, ensure_ascii=False, separators=(",", ":"))
+
+
 # Agent: Completeness Check
 completeness_check = Agent(
     name="Completeness Check",
-    instructions="""You are an assistant that reviews the entire conversation with a user who is a potential first-time home buyer in Ontario, Canada.
-
-Your job:
-1. Look through ALL previous user messages and your messages.
-2. Extract the key fields listed below.
-3. Populate them from the conversation wherever possible.
-4. If a field was never mentioned, leave it as an empty string "".
-5. If and only if ALL required fields have a non-empty value, set "completed_info": true. Otherwise, set it to false.
-6. Always return a single JSON object and nothing else.
-
-Assumptions:
-- Province is always "ON".
-- Do NOT invent values that the user has not said or clearly implied.
-- User may have given answers in earlier turns; use those.
-- Do NOT ask questions in this node — this node only extracts and reports.
-
-Fields to extract (in order):
-
-1. province (always "ON")
-2. city_or_region (city, town, or area in Ontario the user said they want to buy in)
-3. timeline (when they hope to buy: e.g. "0–6 months", "6–12 months", "1–2 years")
-4. eligibility_age_18_plus (did they confirm they are over 18 years of age? "yes" / "no")
-5. eligibility_citizenship_status (Canadian citizen / permanent resident / other)
-6. eligibility_first_time_status (never owned, owned before, spouse owned, etc.)
-7. eligibility_spouse_owned (if married/common-law, did spouse own while together?)
-8. eligibility_property_type (resale / new construction / open to either / not specified)
-9. eligibility_occupancy_plan (will they live in the home within 9 months?)
-10. eligibility_disability_status (user or relative DTC-eligible?)
-11. eligibility_prior_LTT_rebate (have they claimed land transfer tax rebate before?)
-12. daydream_home_type (condo, townhouse, detached, etc.)
-13. daydream_bedrooms (number or range of bedrooms)
-14. daydream_must_haves (parking, accessible, near transit, etc.)
-15. pain_points (down payment, credit, income, etc.)
-16. household_contributors (number of income earners in household)
-17. contributors_1_employment_type
-18. contributors_1_tenure_years_band
-19. contributors_2_employment_type
-20. contributors_2_tenure_years_band
-21. contributors_3_employment_type
-22. contributors_3_tenure_years_band
-23. contributors_4_employment_type
-24. contributors_4_tenure_years_band
-25. income_band (e.g. under 50K, 50–80K, 80–120K, 120–200K, 200K+)
-26. credit_band (use realistic Canadian bands: below 600, 600–659, 660–724, 725–759, 760+)
-27. monthly_debt_payments_band (use DTI-style buckets: under 10%, 10–30%, 30–50%, over 50%)
-28. down_payment_band (as % of expected purchase: under 5%, 5–10%, 10–20%, over 20%)
-
-Output rules:
-Always return a single valid JSON object in the specified schema — no text or commentary outside the JSON.
-If any required field is empty ("" or missing), set "completed_info": false, except the following optional fields:
-"contributors_2_employment_type"
-"contributors_2_tenure_years_band"
-"contributors_3_employment_type"
-"contributors_3_tenure_years_band"
-"contributors_4_employment_type"
-"contributors_4_tenure_years_band"
-
-These contributor fields are optional — they may remain empty if the user has fewer contributors.
-"completed_info": true only when all other fields (besides the optional ones above and "contact_permission") have non-empty, valid values.
-Return JSON in this exact shape:
-
-{
-  "province": "ON",
-  "city_or_region": "",
-  "timeline": "",
-  "daydream_home_type": "",
-  "daydream_bedrooms": "",
-  "daydream_must_haves": "",
-  "pain_points": "",
-  "household_contributors": "",
-  "contributors_1_employment_type": "",
-  "contributors_1_tenure_years_band": "",
-  "contributors_2_employment_type": "",
-  "contributors_2_tenure_years_band": "",
-  "contributors_3_employment_type": "",
-  "contributors_3_tenure_years_band": "",
-  "contributors_4_employment_type": "",
-  "contributors_4_tenure_years_band": "",
-  "income_band": "",
-  "credit_band": "",
-  "monthly_debt_payments_band": "",
-  "down_payment_band": "",
-  "eligibility_age_18_plus": "",
-  "eligibility_citizenship_status": "",
-  "eligibility_first_time_status": "",
-  "eligibility_spouse_owned": "",
-  "eligibility_property_type": "",
-  "eligibility_occupancy_plan": "",
-  "eligibility_disability_status": "",
-  "eligibility_prior_LTT_rebate": "",
-  "completed_info": true or false
-}
+    instructions="""You review a conversation with a potential first-time home buyer in Canada (usually Ontario) and keep their profile up to date.
+
+The last message holds the profile known before this turn, as JSON. Compare it with the whole conversation and return ONLY the fields that are new or whose value changed. Omit every field that is unchanged or still unknown. Return {} when nothing changed.
+
+Rules:
+- Do NOT invent values the user has not said or clearly implied. User answers from earlier turns count.
+- Use the enum values from the schema for every field that has them; pick the closest band for numbers the user gave.
+- province: the two-letter code of the province or territory where they plan to buy. Infer it from the city when that is unambiguous (e.g. Vancouver -> BC); it starts as "ON".
+- Free-text fields (city, home_type, bedrooms, must_haves, pain_points) are short phrases in the user's terms.
+- earners is the number of people contributing to household income; c1 is the first earner, c2 the second, and so on.
+- first_time: "never owned" if neither the user nor their spouse/partner has owned a home, otherwise "owned before".
+- occupy_in_9_months: whether they will move in within 9 months of buying.
+- contact_ok: whether they agreed to receive the Detailed Report.
+- Do NOT ask questions; this step only extracts.
 """,
     model="gpt-4o-mini",
-    output_type=CompletnessCheckSchema,
-    model_settings=ModelSettings(temperature=1, top_p=1, max_tokens=2048, store=True),
+    output_type=_LenientDeltaSchema(),
+    model_settings=ModelSettings(temperature=0, top_p=1, max_tokens=512, store=True),
 )
 
 
@@ -278,128 +491,51 @@ Over 20%
 # Agent: Program Teaser
 program_teaser_agent = Agent(
     name="Program Teaser Agent",
-    instructions="""You are an assistant that evaluates potential eligibility for programs using:
-
-- user-provided information, and
-- program data from a given file.
-
-Your Task
-
-Carefully review all information the user has provided in the conversation.
-
-Thoroughly search the specified file for all relevant programs and their eligibility criteria.
-
-For each program you consider, reason step-by-step whether the user's details appear to meet (or not meet) the criteria.
-
-Clearly explain the reasoning for each program before you give any conclusion about fit.
-
-If information is missing or unclear, explicitly call that out and treat the conclusion as "needs more information."
-
-Never jump straight to conclusions. Always complete the reasoning for each program before you decide whether it is a possible match or likely not a fit.
-
-If user-provided information is very incomplete, you must:
-
-Still show some example programs from the file that might be relevant.
-
-Clearly mark that these are not confirmed matches and that more information is required.
-
-Language Guardrails
-
-Do not state or imply certainty about eligibility.
+    instructions="""You are Dorthy, a warm, plainspoken guide for first-time home buyers in Ontario, Canada. Use Canadian spellings.
 
-Never say: "You are eligible."
+The conversation ends with a precomputed eligibility assessment. It already sorts every program into "POSSIBLE MATCHES", "NEEDS MORE INFO" and "LIKELY NOT A FIT", with the criteria checked and which of the user's details decided it. Your only job is to turn that assessment into a short, friendly summary.
 
-Instead say: "You may be eligible," "This looks like a potential fit," or "You might qualify, but we need more information to be sure."
+Rules:
+- Use only the programs and buckets in the assessment. Do not add, drop or move programs.
+- Programs marked "unverified" have not been checked against their source recently. Before quoting their amounts or criteria, confirm them in the program documents with file_search. If the documents differ, use what the documents say and suggest the user confirm the details with the program.
+- Use file_search as well when the user asks for details the assessment does not cover.
+- Do not state or imply certainty about eligibility. Never say "You are eligible." Say "You may be eligible", "This looks like a potential fit" or "You might qualify, but we need more information to be sure."
+- For "NEEDS MORE INFO" programs, name the missing details in plain words.
+- If there are no possible matches, say so kindly and point to the details that would help.
+- Always say: "I can share general information, but this isn't financial or legal advice."
 
-Be explicit when information is missing: e.g., "We would need to know your approximate annual revenue before judging fit."
-
-Output Format
-
-Your response must be in structured markdown (not a code block) and follow this structure exactly:
+Output format (structured markdown, not a code block):
 
 **Possible Matches (based on current info)**
 
-For each program that appears to be a potential fit given the current information:
-
-**Program Name 1** —
-
-**Reasoning:** step-by-step comparison of user details vs. eligibility criteria.
-
-**Eligibility criteria:** clearly list the key requirements you checked.
-
-**Conclusion:** soft, non-certain language (e.g., "You may be eligible based on X and Y, but we would still need Z to be sure.")
-
-**Program Name 2** —
-
-**Reasoning:** …
-
-**Eligibility criteria:** …
-
-**Conclusion:** …
-
-(continue for all potential matches)
+**Program Name** — one sentence on what it offers. **Why it may fit:** the criteria the user appears to meet.
 
 ---
 
 **Likely Not a Fit / Need More Info**
 
-For each program that currently looks unlikely or cannot be assessed due to missing info:
-
-**Program Name 1** —
-
-**Reasoning:** step-by-step explanation of where the user's details diverge from the criteria or which key details are missing.
-
-**Eligibility criteria:** clearly list the relevant requirements.
-
-**Conclusion:** use soft, cautious language (e.g., "Likely not a fit because it appears to require higher revenue / a different region / longer operating history." or "Cannot judge fit — needs more info on [missing fields].")
-
-**Program Name 2** —
-
-**Reasoning:** …
-
-**Eligibility criteria:** …
-
-**Conclusion:** …
-
-(continue for all programs that don't match or need more info)
-
-Guardrails (must follow)
+**Program Name** — **Why:** the criteria that don't line up, or the details we still need.
 
-If the user info is very incomplete, you must still:
-
-Show example programs from the file as illustrative possibilities, and
-
-Clearly state: "These are examples only and need more info before we can assess fit."
-
-Always:
-
-Present your reasoning first under each program.
-
-Use soft, non-absolute conclusions ("may be eligible," "potential fit," "likely not a fit," "needs more info").
-
-Avoid any definitive statements of eligibility.
-
-Important Objective:
-
-For every program you consider, reason through the criteria step-by-step using the user's details, then assign it to either "Possible Matches (based on current info)" or "Likely Not a Fit / Need More Info". Never present a program as a possible match without first showing the reasoning and criteria you used.
+Keep each program to two or three sentences.
 """,
     model="gpt-4o",
     tools=[file_search],
-    model_settings=ModelSettings(temperature=1, top_p=1, max_tokens=4096, store=True),
+    model_settings=ModelSettings(temperature=0.4, top_p=1, max_tokens=1200, store=True),
 )
 
 
-# Agent: Ask Email
-ask_email = Agent(
-    name="Ask Email",
-    instructions="""You are a warm, compassionate assistant. Use Canadian spellings throughout all communication. The user has agreed to receive the Detailed Report. Politely and gently request the user's email address, expressing appreciation for their interest.
+# Agent: Report Confirmation (the detailed report is queued when this stage is picked)
+report_confirmation = Agent(
+    name="Report Confirmation",
+    instructions="""You are a warm, compassionate assistant. Use Canadian spellings throughout all communication. The user has agreed to receive the Detailed Report, and it is being prepared now. It will be posted right here in this chat within a few minutes.
 
+- Thank the user for their interest and let them know the report is on its way in this chat.
 - Remain empathetic and approachable in tone.
 - Use Canadian spellings (e.g., "favour" instead of "favor", "centre" instead of "center").
 - Keep your message brief and polite.
-- Do not proceed to provide the Detailed Report or request any further information until the user provides their email.
+- Never ask for an email address, phone number or any other contact details; the report does not need them.
 
-Output format: Single, friendly paragraph requesting the user's email address.
+Output format: Single, friendly paragraph.
 
 ---
 
@@ -409,93 +545,38 @@ Output format: Single, friendly paragraph requesting the user's email address.
 User has agreed to receive the Detailed Report.
 
 *Output:*  
-Thank you so much for your interest in the Detailed Report. May I kindly ask for your email address to send the information to you? If you have any preferences or special instructions, please feel free to let me know.
-
----
-
-**Reminder:**  
-Your goal is to politely and compassionately request the user's email address using Canadian spellings and a warm tone.
+Thank you so much for your interest in the Detailed Report! I'm putting it together for you now, and it will appear right here in our chat in a few minutes. In the meantime, feel free to ask me anything about the programs we discussed.
 """,
     model="gpt-4o",
     model_settings=ModelSettings(temperature=1, top_p=1, max_tokens=2048, store=True),
 )
 
 
-async def run_dorthy_workflow(
-    conversation_history: list[dict[str, Any]], user_input: str
-) -> dict[str, Any]:
-    """
-    Run the Dorthy AI workflow with the given conversation history and user input.
+# Agent: Detailed Report (runs in the background report queue, not in the chat stream)
+detailed_report_agent = Agent(
+    name="Detailed Report Agent",
+    instructions="""You are Dorthy, a warm, plainspoken guide for first-time home buyers in Ontario, Canada. Use Canadian spellings.
 
-    Args:
-        conversation_history: List of previous messages in the conversation
-        user_input: Current user input text
+You are writing the Detailed Report the user asked for. You are given their profile as JSON, a precomputed eligibility assessment that sorts every program into "POSSIBLE MATCHES", "NEEDS MORE INFO" and "LIKELY NOT A FIT", and sometimes excerpts from the program documents.
 
-    Returns:
-        Dictionary containing the agent's response and metadata
-    """
-    # Add the user input to conversation history
-    conversation_history.append(
-        {
-            "role": "user",
-            "content": [{"type": "input_text", "text": user_input}],
-        }
-    )
+Rules:
+- Use only the programs and buckets in the assessment. Do not add, drop or move programs.
+- Programs marked "unverified" have not been checked against their source recently. Before quoting their amounts or criteria, confirm them in the program documents with file_search. If the documents differ, use what the documents say and suggest the user confirm the details with the program.
+- Use file_search as well when the user asks for details the assessment does not cover.
+- Use the document excerpts for amounts, deadlines and how to apply; never invent figures.
+- Do not state or imply certainty about eligibility. Say "You may be eligible" or "This looks like a potential fit."
+- Always say: "I can share general information, but this isn't financial or legal advice."
 
-    # Step 1: Check completeness of information
-    completeness_result = await Runner.run(
-        completeness_check,
-        input=conversation_history,
-        run_config=RunConfig(
-            trace_metadata={
-                "__trace_source__": "chatkit",
-                "workflow": "dorthy-ai",
-            }
-        ),
-    )
+Output format (structured markdown, not a code block):
 
-    # Extract the completeness check result
-    completeness_data = completeness_result.final_output.model_dump()
-
-    # Step 2: Based on completeness, either gather more info or show program teaser
-    if completeness_data.get("completed_info"):
-        # Information is complete, show program teaser
-        program_result = await Runner.run(
-            program_teaser_agent,
-            input=conversation_history,
-            run_config=RunConfig(
-                trace_metadata={
-                    "__trace_source__": "chatkit",
-                    "workflow": "dorthy-ai",
-                }
-            ),
-        )
-
-        response_text = program_result.final_output_as(str)
-
-        return {
-            "response": response_text,
-            "stage": "program_teaser",
-            "completeness": completeness_data,
-        }
-    else:
-        # Information is incomplete, gather more
-        gather_result = await Runner.run(
-            gather_more_information,
-            input=conversation_history,
-            run_config=RunConfig(
-                trace_metadata={
-                    "__trace_source__": "chatkit",
-                    "workflow": "dorthy-ai",
-                }
-            ),
-        )
-
-        response_text = gather_result.final_output_as(str)
-
-        return {
-            "response": response_text,
-            "stage": "gathering_info",
-            "completeness": completeness_data,
-        }
+**Your Home Buying Snapshot** — two or three sentences recapping the user's situation and goals.
 
+**Programs That May Fit** — for each possible match: what it offers, why it may fit, and the next step to apply.
+
+**Programs Worth a Closer Look** — for each "NEEDS MORE INFO" program: what it offers and the details that would settle it.
+
+**Suggested Next Steps** — a short numbered checklist in the order the user should tackle it.
+""",
+    model="gpt-4o",
+    model_settings=ModelSettings(temperature=0.4, top_p=1, max_tokens=4096, store=True),
+)
@@ -4,6 +4,7 @@ DorthyAssistantServer implements the ChatKitServer interface for home buyer assi
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 from datetime import datetime
@@ -11,6 +12,7 @@ from typing import Any, AsyncIterator
 
 from chatkit.agents import AgentContext
 from chatkit.server import ChatKitServer
+from chatkit.store import NotFoundError
 from chatkit.types import (
     Action,
     AssistantMessageContent,
@@ -23,10 +25,17 @@ from chatkit.types import (
     WidgetItem,
 )
 from dotenv import load_dotenv
-from openai.types.responses import ResponseInputContentParam
+from openai.types.responses import ResponseInputContentParam, ResponseInputTextParam
 
-from .memory_store import MemoryStore
+from .attachment_store import LocalAttachmentStore, is_text
+from .data_dir import data_path
+from .dorthy_agent import CompletnessCheckSchema
+from .memory_store import PARTITION_KEY, MemoryStore, partition_of
+from .program_prefetch import program_prefetcher
+from .report_jobs import JobTable, ReportJob, ReportQueue
+from .request_profiler import profiled
 from .thread_item_converter import BasicThreadItemConverter
+from .tracing import set_attributes, span
 
 # Load environment variables
 load_dotenv()
@@ -34,14 +43,30 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Widget action that queues a detailed report (routing to report_confirmation does too)
+REPORT_ACTION = "report.request"
+# Characters of an attached document passed to the agents (about 5k tokens)
+ATTACHMENT_MAX_CHARS = int(os.getenv("ATTACHMENT_MAX_CHARS", "20000"))
+
 
 class DorthyAssistantServer(ChatKitServer[dict[str, Any]]):
     """ChatKit server for Dorthy AI home buyer assistant."""
 
     def __init__(self) -> None:
-        self.store: MemoryStore = MemoryStore()
-        super().__init__(self.store)
-        self.thread_item_converter = BasicThreadItemConverter()
+        self.attachments = LocalAttachmentStore.from_env()
+        self.store: MemoryStore = MemoryStore(attachments=self.attachments)
+        super().__init__(self.store, attachment_store=self.attachments)
+        self.thread_item_converter = BasicThreadItemConverter(self.to_message_content)
+        # Detailed reports take minutes, so they run off the request path
+        self.reports = ReportQueue(
+            JobTable(data_path("REPORT_JOBS_DB", "report_jobs.sqlite3")),
+            self._generate_report,
+            workers=int(os.getenv("REPORT_WORKERS", "2")),
+            max_attempts=int(os.getenv("REPORT_MAX_ATTEMPTS", "3")),
+            on_complete=self._deliver_report,
+        )
+        # Background routing reconciliations; held here so they are not collected mid-run
+        self._reconciling: set[asyncio.Task[None]] = set()
 
         # Verify API key is set
         if not os.getenv("OPENAI_API_KEY"):
@@ -56,11 +81,36 @@ class DorthyAssistantServer(ChatKitServer[dict[str, Any]]):
         context: dict[str, Any],
     ) -> AsyncIterator[ThreadStreamEvent]:
         """Handle custom actions from widgets."""
-        # Placeholder for future actions (e.g., email submission)
         logger.info(f"Action received: {action.type}")
-        return
-        yield  # Make this an async generator
+        if action.type != REPORT_ACTION:
+            return
+        text = await self._request_report(thread, context)
+        yield ThreadItemDoneEvent(item=self._assistant_message(thread, text, context))
+
+    async def _request_report(
+        self,
+        thread: ThreadMetadata,
+        context: dict[str, Any],
+        profile: CompletnessCheckSchema | None = None,
+    ) -> str:
+        """Queue the thread's detailed report; returns the reply for the user."""
+        from .dorthy_workflow import detailed_report_request
 
+        payload = detailed_report_request(thread, profile)
+        if payload is None:
+            return (
+                "I'd love to put together your detailed report! I just need a few more "
+                "details about your situation first."
+            )
+        # The report is posted back into the thread from outside any request
+        payload[PARTITION_KEY] = partition_of(context)
+        await self.reports.submit(thread.id, payload)
+        return (
+            "Thank you! I'm preparing your detailed report now. It will appear right "
+            "here in our chat as soon as it's ready."
+        )
+
+    @profiled
     async def respond(
         self,
         thread: ThreadMetadata,
@@ -69,58 +119,141 @@ class DorthyAssistantServer(ChatKitServer[dict[str, Any]]):
     ) -> AsyncIterator[ThreadStreamEvent]:
         """Generate a response to the user's message."""
         # Import here to avoid circular dependency issues
-        from .dorthy_workflow import run_dorthy_workflow_streamed
-
-        from agents import Runner
         from chatkit.agents import stream_agent_response
 
-        # Create agent context
-        agent_context = AgentContext(
-            thread=thread,
-            store=self.store,
-            request_context=context,
-        )
+        from .dorthy_workflow import profile_from, remember_routing, run_dorthy_workflow
 
-        # Load conversation history from the thread
-        items_page = await self.store.load_thread_items(
-            thread.id,
-            after=None,
-            limit=50,  # Load more history for better context
-            order="desc",
-            context=context,
-        )
+        with span("chatkit.respond", thread_id=thread.id) as turn:
+            # Create agent context
+            agent_context = AgentContext(
+                thread=thread,
+                store=self.store,
+                request_context=context,
+            )
 
-        # Runner expects the most recent message to be last
-        items = list(reversed(items_page.data))
+            # Load conversation history from the thread
+            with span("store.load_thread_items", thread_id=thread.id) as load:
+                items_page = await self.store.load_thread_items(
+                    thread.id,
+                    after=None,
+                    limit=50,  # Load more history for better context
+                    order="desc",
+                    context=context,
+                )
+                set_attributes(load, items=len(items_page.data))
 
-        # Translate ChatKit thread items into agent input
-        input_items = await self.thread_item_converter.to_agent_input(items)
+            # Runner expects the most recent message to be last
+            items = list(reversed(items_page.data))
 
-        # Update thread title on first interaction
-        if not thread.title or thread.title == "New chat":
-            thread.title = "Home Buying Journey"
-            await self.store.save_thread(thread, context)
+            # Translate ChatKit thread items into agent input
+            with span("history.convert", thread_id=thread.id, items=len(items)):
+                input_items = await self.thread_item_converter.to_agent_input(items)
 
-        # Run the complete workflow to determine which agent to use
-        # This runs completeness_check and returns the appropriate agent
-        stage, agent_to_stream = await run_dorthy_workflow_streamed(input_items)
-        
-        logger.info(f"Workflow routing to stage: {stage}")
+            # Update thread title on first interaction
+            if not thread.title or thread.title == "New chat":
+                thread.title = "Home Buying Journey"
+                with span("store.save_thread", thread_id=thread.id):
+                    await self.store.save_thread(thread, context)
 
-        # Stream the selected agent's response
-        result = Runner.run_streamed(
-            agent_to_stream,
-            input_items,
-        )
+            # Route through the stage graph; the selected agent is already streaming
+            report = await self.reports.latest(thread.id)
+            run = await run_dorthy_workflow(input_items, thread=thread, report=report)
+            set_attributes(turn, stage=run.stage)
 
-        # Stream the response back to the client
-        async for event in stream_agent_response(agent_context, result):
-            yield event
+            # The terminal stage's span stays open until run.complete(), however the turn ends
+            try:
+                profile = profile_from(run.outputs)
+
+                # The user agreed to the detailed report; the agent confirms while it is queued
+                if run.stage == "report_confirmation":
+                    await self._request_report(thread, context, profile)
+
+                logger.info(f"Workflow routing to stage: {run.stage}")
+                if run.late:
+                    # Routing fell back to the last known stage; fix up the thread once it lands
+                    task = asyncio.create_task(self._reconcile_routing(thread, run, context))
+                    self._reconciling.add(task)
+                    task.add_done_callback(self._reconciling.discard)
+                else:
+                    remember_routing(thread, run.stage, profile)
+
+                # Nearly complete profiles will route to the teaser next turn; warm its context
+                if run.stage == "gathering_info":
+                    program_prefetcher.schedule(thread, profile, self.store, context)
+
+                # Stream the response back to the client
+                with span("stream.forward", thread_id=thread.id, stage=run.stage) as forward:
+                    events = 0
+                    async for event in stream_agent_response(agent_context, run.result):
+                        events += 1
+                        yield event
+                    set_attributes(forward, events=events)
+            finally:
+                run.complete()
         return
 
-    async def to_message_content(self, _input: Attachment) -> ResponseInputContentParam:
-        """Handle file attachments - not supported in this demo."""
-        raise RuntimeError("File attachments are not currently supported.")
+    def _assistant_message(
+        self, thread: ThreadMetadata, text: str, context: dict[str, Any]
+    ) -> AssistantMessageItem:
+        return AssistantMessageItem(
+            id=self.store.generate_item_id("message", thread, context),
+            thread_id=thread.id,
+            created_at=datetime.now(),
+            content=[AssistantMessageContent(text=text)],
+        )
+
+    async def _generate_report(self, payload: dict[str, Any]) -> str:
+        from .dorthy_workflow import generate_detailed_report
+
+        return await generate_detailed_report(payload)
+
+    async def _deliver_report(self, job: ReportJob) -> None:
+        """Post a finished report into its thread; clients see it on their next read."""
+        context: dict[str, Any] = {PARTITION_KEY: partition_of(job.payload)}
+        thread = await self.store.load_thread(job.thread_id, context)
+        if job.status == "succeeded" and job.result:
+            text = job.result
+        else:
+            text = (
+                "I'm sorry, I wasn't able to finish your detailed report. "
+                "Please ask me again in a little while."
+            )
+        # The job table records the report's status, so the thread itself is not saved; a
+        # turn in flight holds its own copy of the thread and would overwrite it.
+        await self.store.add_thread_item(
+            thread.id, self._assistant_message(thread, text, context), context
+        )
+
+    async def _reconcile_routing(
+        self, thread: ThreadMetadata, run: Any, context: dict[str, Any]
+    ) -> None:
+        from .dorthy_workflow import reconcile_routing
+
+        try:
+            if await reconcile_routing(thread, run):
+                await self.store.save_thread(thread, context)
+        except Exception as e:
+            logger.warning(f"Routing reconciliation failed for thread {thread.id}: {e}")
+
+    async def to_message_content(self, input: Attachment) -> ResponseInputContentParam:
+        """Text attachments (letters, statements) as input text, decoded off the event loop."""
+        if not is_text(input.mime_type):
+            text = (
+                f"[The user attached {input.name} ({input.mime_type}), which can't be read "
+                "here. Ask them to paste the relevant details as text.]"
+            )
+            return ResponseInputTextParam(type="input_text", text=text)
+        try:
+            body, truncated = await asyncio.to_thread(
+                self.attachments.read_text, input.id, ATTACHMENT_MAX_CHARS
+            )
+        except NotFoundError:
+            text = f"[The user attached {input.name}, which has since been removed.]"
+            return ResponseInputTextParam(type="input_text", text=text)
+        if truncated:
+            body += f"\n[... truncated after {ATTACHMENT_MAX_CHARS} characters]"
+        text = f"[The user attached {input.name}:]\n{body}"
+        return ResponseInputTextParam(type="input_text", text=text)
 
 
 def create_chatkit_server() -> DorthyAssistantServer | None:
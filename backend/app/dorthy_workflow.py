@@ -1,6 +1,6 @@
 """
 Complete Dorthy AI workflow with multi-agent routing.
-This implements the full workflow from your Agent Builder design.
+This implements the full workflow from your Agent Builder design as a stage graph.
 """
 
 from __future__ import annotations
@@ -8,18 +8,33 @@ from __future__ import annotations
 import logging
 import os
 from pathlib import Path
-from typing import Any
+from typing import Any, Sequence
 
-from agents import Runner, RunConfig
+import orjson
+from agents import Runner
+from agents.items import TResponseInputItem
+from chatkit.types import ThreadMetadata
 from dotenv import load_dotenv
-from openai.types.responses import ResponseInputItemParam
 
 from .dorthy_agent import (
+    CompletnessCheckSchema,
+    ProfileDelta,
+    compact_profile,
     completeness_check,
+    detailed_report_agent,
+    expand_profile,
     gather_more_information,
     program_teaser_agent,
-    ask_email,
+    report_confirmation,
 )
+from .input_projection import conversation_view, extractor_view
+from .latency_budget import LatencyBudget
+from .metrics import register_metrics
+from .program_prefetch import prefetched_context
+from .program_rules import program_matcher
+from .report_jobs import ReportJob
+from .stage_graph import GraphRun, Route, Stage, StageGraph, StageHooks, StageOutputs
+from .tracing import record_usage, set_attributes, span
 
 # Load environment variables
 env_path = Path(__file__).parent.parent / ".env"
@@ -27,146 +42,229 @@ load_dotenv(dotenv_path=env_path)
 
 logger = logging.getLogger(__name__)
 
+_AFFIRMATIVE = {"yes", "y", "true", "ok", "sure"}
+
+ROUTING_METADATA_KEY = "routing"
+
+# Nothing streams until routing returns, so its slow tail is hedged and capped.
+ROUTING_BUDGET = LatencyBudget(
+    "completeness_check",
+    hard_budget=float(os.getenv("ROUTING_HARD_BUDGET_SECONDS", "6.0")),
+    initial_hedge_after=float(os.getenv("ROUTING_INITIAL_HEDGE_SECONDS", "2.5")),
+)
+register_metrics("routing", ROUTING_BUDGET.stats)
+
+
+def profile_from(outputs: StageOutputs) -> CompletnessCheckSchema:
+    """Return the completeness check output of a graph run."""
+    return outputs["completeness_check"]
+
+
+def remember_routing(thread: ThreadMetadata, stage: str, profile: CompletnessCheckSchema) -> None:
+    """Record the turn's stage and profile on the thread for budget fallbacks."""
+    thread.metadata[ROUTING_METADATA_KEY] = {"stage": stage, "profile": profile.model_dump()}
+
+
+def last_known_profile(thread: ThreadMetadata | None) -> CompletnessCheckSchema | None:
+    """The profile recorded by the thread's last routing, if any."""
+    routing = thread.metadata.get(ROUTING_METADATA_KEY) if thread else None
+    if not routing:
+        return None
+    return CompletnessCheckSchema.model_validate(routing["profile"])
+
+
+def _known_profile(outputs: StageOutputs) -> CompletnessCheckSchema | None:
+    """Fallback for an over-budget completeness check: reuse the thread's last profile.
+
+    Parsed once per turn by ``run_dorthy_workflow`` and seeded into the outputs.
+    """
+    return outputs.get("known_profile")
+
+
+def _with_known_profile(
+    outputs: StageOutputs, input_items: list[TResponseInputItem]
+) -> list[TResponseInputItem]:
+    """Give the completeness check its baseline so it only has to report changes."""
+    baseline = compact_profile(_known_profile(outputs))
+    input_items.append({"role": "developer", "content": f"Known profile: {baseline}"})
+    return input_items
+
+
+def _expand_delta(outputs: StageOutputs, delta: ProfileDelta) -> CompletnessCheckSchema:
+    return expand_profile(_known_profile(outputs), delta)
+
+
+def _info_complete(outputs: StageOutputs) -> bool:
+    return profile_from(outputs).completed_info
+
+
+def report_requested(report: ReportJob | None) -> bool:
+    """Whether the thread's latest report is queued or delivered (a failed one can be redone)."""
+    return report is not None and report.status != "failed"
+
+
+def _wants_detailed_report(outputs: StageOutputs) -> bool:
+    # contact_permission stays "yes" once given; after the report is requested the
+    # conversation goes back to the teaser instead of queueing it again.
+    if report_requested(outputs.get("report")):
+        return False
+    profile = profile_from(outputs)
+    return profile.completed_info and profile.contact_permission.strip().lower() in _AFFIRMATIVE
+
+
+def _with_eligibility(
+    outputs: StageOutputs, input_items: list[TResponseInputItem]
+) -> list[TResponseInputItem]:
+    """Append the rules-engine assessment so the teaser only has to write prose."""
+    report = program_matcher.match(profile_from(outputs))
+    logger.info(
+        f"Eligibility: {len(report.matches)} matches, {len(report.needs_info)} need info, "
+        f"{len(report.no_fit)} no fit"
+    )
+    prompt = report.to_prompt()
+    candidates = [entry.program.name for entry in report.matches + report.needs_info]
+    excerpts = prefetched_context(outputs.get("thread"), candidates)
+    if excerpts:
+        prompt = f"{prompt}\n\n{excerpts}"
+    input_items.append({"role": "developer", "content": prompt})
+    return input_items
+
+
+# Workflow:
+# 1. completeness_check extracts the user's information (routing stage) as a delta
+#    against the thread's last known profile, expanded locally. It sees only the user's
+#    answers and the questions they replied to. Past the hard budget it falls back to
+#    that last known profile, i.e. last stage.
+# 2. If info is complete and the user agreed to a detailed report that hasn't been
+#    requested yet -> report_confirmation (the server queues the report)
+# 3. If info is complete -> program_teaser, narrating the rules-engine matches
+# 4. Otherwise -> gathering_info (Dorthy asks more questions)
+DORTHY_GRAPH = StageGraph(
+    stages=[
+        Stage(
+            "completeness_check",
+            completeness_check,
+            project=extractor_view,
+            prepare=_with_known_profile,
+            output=_expand_delta,
+            budget=ROUTING_BUDGET,
+            fallback=_known_profile,
+        ),
+        Stage("gathering_info", gather_more_information, terminal=True, project=conversation_view),
+        Stage(
+            "program_teaser",
+            program_teaser_agent,
+            terminal=True,
+            project=conversation_view,
+            prepare=_with_eligibility,
+        ),
+        Stage(
+            "report_confirmation",
+            report_confirmation,
+            terminal=True,
+            project=conversation_view,
+        ),
+    ],
+    routes=[
+        Route("report_confirmation", _wants_detailed_report),
+        Route("program_teaser", _info_complete),
+    ],
+    default="gathering_info",
+    workflow="dorthy-ai",
+)
+
 
 async def run_dorthy_workflow(
-    conversation_history: list[ResponseInputItemParam],
-) -> dict[str, Any]:
+    conversation_history: Sequence[TResponseInputItem],
+    hooks: StageHooks | None = None,
+    thread: ThreadMetadata | None = None,
+    report: ReportJob | None = None,
+) -> GraphRun:
     """
-    Run the complete Dorthy AI workflow with multi-agent routing.
-    
-    Workflow:
-    1. Run completeness_check to extract user information
-    2. If info is complete:
-       - Run program_teaser_agent to show potential programs
-       - (Future) Offer detailed report via ask_email
-    3. If info is incomplete:
-       - Run gather_more_information (Dorthy asks questions)
-    
+    Route a turn through the Dorthy graph and start streaming the selected agent.
+
     Args:
-        conversation_history: List of previous messages in agent input format
-        
+        conversation_history: Previous messages in agent input format (not mutated)
+        hooks: Optional per-stage timing hooks
+        thread: The thread being answered; gives the teaser access to prefetched context
+        report: The thread's latest report job, so a requested report is not queued twice
+
     Returns:
-        Dictionary containing:
-        - stage: "gathering_info" | "program_teaser" | "ask_email"
-        - response: The agent's response text
-        - completeness: The completeness check result (optional)
+        GraphRun with the selected stage ("gathering_info" | "program_teaser" |
+        "report_confirmation"), the routing outputs and the streaming result to forward.
+        If routing fell back, ``late`` holds the real completeness check result.
     """
-    
-    try:
-        # Step 1: Run completeness check to extract user information
-        logger.info("Running completeness check...")
-        completeness_result = await Runner.run(
-            completeness_check,
-            input=conversation_history,
-            run_config=RunConfig(
-                trace_metadata={
-                    "__trace_source__": "chatkit",
-                    "workflow": "dorthy-ai",
-                    "step": "completeness_check",
-                }
-            ),
-        )
-        
-        # Extract the completeness data
-        completeness_data = completeness_result.final_output.model_dump()
-        completed_info = completeness_data.get("completed_info", False)
-        
-        logger.info(f"Completeness check result: completed_info={completed_info}")
-        
-        # Step 2: Route based on completeness
-        if completed_info:
-            # Information is complete - show program teaser
-            logger.info("Info complete - running program teaser agent...")
-            
-            program_result = await Runner.run(
-                program_teaser_agent,
-                input=conversation_history,
-                run_config=RunConfig(
-                    trace_metadata={
-                        "__trace_source__": "chatkit",
-                        "workflow": "dorthy-ai",
-                        "step": "program_teaser",
-                    }
-                ),
-            )
-            
-            response_text = program_result.final_output_as(str)
-            
-            return {
-                "stage": "program_teaser",
-                "response": response_text,
-                "completeness": completeness_data,
-            }
-            
-        else:
-            # Information is incomplete - gather more info
-            logger.info("Info incomplete - running gather more information agent...")
-            
-            gather_result = await Runner.run(
-                gather_more_information,
-                input=conversation_history,
-                run_config=RunConfig(
-                    trace_metadata={
-                        "__trace_source__": "chatkit",
-                        "workflow": "dorthy-ai",
-                        "step": "gather_info",
-                    }
-                ),
-            )
-            
-            response_text = gather_result.final_output_as(str)
-            
-            return {
-                "stage": "gathering_info",
-                "response": response_text,
-                "completeness": completeness_data,
+    with span("workflow.route", thread_id=thread.id if thread else None) as route_span:
+        try:
+            seed = {
+                "thread": thread,
+                "report": report,
+                "known_profile": last_known_profile(thread),
             }
-            
-    except Exception as e:
-        logger.error(f"Error in Dorthy workflow: {e}", exc_info=True)
-        raise
+            run = await DORTHY_GRAPH.run(conversation_history, hooks=hooks, seed=seed)
+        except Exception as e:
+            logger.error(f"Error in Dorthy workflow routing: {e}", exc_info=True)
+            raise
 
+        profile = profile_from(run.outputs)
+        logger.info(f"Completeness check result: completed_info={profile.completed_info}")
+        set_attributes(
+            route_span,
+            stage=run.stage,
+            completed_info=profile.completed_info,
+            fallback=bool(run.late),
+        )
+    return run
 
-async def run_dorthy_workflow_streamed(
-    conversation_history: list[ResponseInputItemParam],
-) -> tuple[str, Any]:
-    """
-    Run the workflow and determine which agent to stream.
-    
-    Returns:
-        Tuple of (stage, agent_to_stream) where agent is the Agent object
+
+async def reconcile_routing(thread: ThreadMetadata, run: GraphRun) -> bool:
+    """Wait for a late completeness check and record what routing should have been."""
+    pending = run.late.get("completeness_check")
+    if pending is None:
+        return False
+    profile = await pending
+    stage = DORTHY_GRAPH.select({**run.outputs, "completeness_check": profile})
+    if stage != run.stage:
+        logger.info(f"Late routing for thread {thread.id}: {run.stage} -> {stage}")
+    remember_routing(thread, stage, profile)
+    return True
+
+
+def detailed_report_request(
+    thread: ThreadMetadata, profile: CompletnessCheckSchema | None = None
+) -> dict[str, Any] | None:
+    """Build a report job payload; None until the profile is complete.
+
+    ``profile`` defaults to the thread's last routed profile. The report is posted into
+    the thread, so the job needs no contact details.
     """
-    
-    try:
-        # Step 1: Run completeness check (non-streamed, it's fast)
-        logger.info("Running completeness check...")
-        completeness_result = await Runner.run(
-            completeness_check,
-            input=conversation_history,
-            run_config=RunConfig(
-                trace_metadata={
-                    "__trace_source__": "chatkit",
-                    "workflow": "dorthy-ai",
-                    "step": "completeness_check",
-                }
-            ),
-        )
-        
-        # Extract the completeness data
-        completeness_data = completeness_result.final_output.model_dump()
-        completed_info = completeness_data.get("completed_info", False)
-        
-        logger.info(f"Completeness check result: completed_info={completed_info}")
-        
-        # Step 2: Determine which agent to stream
-        if completed_info:
-            logger.info("Info complete - will stream program teaser agent")
-            return ("program_teaser", program_teaser_agent)
-        else:
-            logger.info("Info incomplete - will stream gather more information agent")
-            return ("gathering_info", gather_more_information)
-            
-    except Exception as e:
-        logger.error(f"Error in Dorthy workflow routing: {e}", exc_info=True)
-        raise
+    if profile is None:
+        profile = last_known_profile(thread)
+    if profile is None or not profile.completed_info:
+        return None
+    report = program_matcher.match(profile)
+    candidates = [entry.program.name for entry in report.matches + report.needs_info]
+    return {
+        "profile": profile.model_dump(),
+        "excerpts": prefetched_context(thread, candidates),
+    }
 
+
+async def generate_detailed_report(payload: dict[str, Any]) -> str:
+    """Write the detailed report for a job built by ``detailed_report_request``."""
+    profile = CompletnessCheckSchema.model_validate(payload["profile"])
+    prompt = program_matcher.match(profile).to_prompt()
+    if payload.get("excerpts"):
+        prompt = f"{prompt}\n\n{payload['excerpts']}"
+    input_items: list[TResponseInputItem] = [
+        {"role": "user", "content": f"My profile: {orjson.dumps(payload['profile']).decode()}"},
+        {"role": "developer", "content": prompt},
+    ]
+    with span("agent.run", stage="detailed_report", agent=detailed_report_agent.name) as run_span:
+        result = await Runner.run(
+            detailed_report_agent,
+            input=input_items,
+            run_config=DORTHY_GRAPH.run_config("detailed_report"),
+        )
+        record_usage(run_span, result.context_wrapper.usage)
+    return str(result.final_output)
@@ -0,0 +1,164 @@
+"""
+Per-agent views of the converted conversation.
+
+Every stage used to receive the full history, including the privacy notice and the
+multi-kilobyte program summaries Dorthy wrote earlier. A projection trims that
+history to what one agent needs before its ``Runner`` call:
+
+- ``extractor_view``: user turns, each preceded only by the question it answered
+- ``conversation_view``: the full dialogue, with earlier boilerplate and repeated
+  assistant messages collapsed into short placeholders (the latest assistant
+  message is kept verbatim so follow-ups still have it)
+
+Savings are estimated per stage, logged and exported under ``projection`` in
+``/metrics``.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from typing import Any, Callable, Sequence
+
+import orjson
+from agents.items import TResponseInputItem
+
+from .metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+Projection = Callable[[Sequence[TResponseInputItem]], list[TResponseInputItem]]
+
+# Assistant messages later turns don't need verbatim: (marker, placeholder)
+_BOILERPLATE = (
+    ("protect your privacy", "Dorthy showed the privacy notice"),
+    ("**Possible Matches", "Dorthy shared the program summary"),
+)
+_WIDGET_PREFIX = "The following graphical UI widget"
+_QUESTION = re.compile(r"[^.!?\n]*\?")
+_PROGRAM = re.compile(r"\*\*([^*\n]+)\*\*\s+—")
+# Shorter assistant messages are cheap enough to repeat as-is
+_MIN_COLLAPSE_CHARS = 200
+_MAX_QUESTION_CHARS = 300
+
+
+def _role(item: TResponseInputItem) -> str | None:
+    if isinstance(item, dict) and item.get("type", "message") == "message":
+        role = item.get("role")
+        return role if isinstance(role, str) else None
+    return None
+
+
+def _text(item: TResponseInputItem) -> str:
+    content = item.get("content") if isinstance(item, dict) else None
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _message(role: str, text: str) -> TResponseInputItem:
+    message: Any = {"type": "message", "role": role, "content": text}
+    return message
+
+
+def _last_question(text: str) -> str | None:
+    """The question(s) in the last paragraph that asks any, which a reply answers."""
+    for paragraph in reversed(text.split("\n\n")):
+        questions = [q.strip().strip("*").strip() for q in _QUESTION.findall(paragraph)]
+        asked = " ".join(q for q in questions if q)
+        if asked:
+            return asked[-_MAX_QUESTION_CHARS:]
+    return None
+
+
+def _collapsed(text: str, seen: set[str]) -> str | None:
+    """Placeholder for a boilerplate or repeated assistant message, else None."""
+    label = next((label for marker, label in _BOILERPLATE if marker in text), None)
+    if label is None and text in seen:
+        label = "Dorthy repeated an earlier message"
+    if label is None:
+        return None
+    programs = list(dict.fromkeys(_PROGRAM.findall(text)))
+    if programs:
+        label = f"{label} ({', '.join(programs)})"
+    question = _last_question(text)
+    return f"[{label}.] {question}" if question else f"[{label}.]"
+
+
+def extractor_view(items: Sequence[TResponseInputItem]) -> list[TResponseInputItem]:
+    """User turns, each preceded by the question from the assistant message before it."""
+    projected: list[TResponseInputItem] = []
+    question: str | None = None
+    for item in items:
+        role = _role(item)
+        if role == "assistant":
+            question = _last_question(_text(item))
+        elif role == "user":
+            if _text(item).startswith(_WIDGET_PREFIX):
+                continue
+            if question:
+                projected.append(_message("assistant", question))
+                question = None
+            projected.append(item)
+        elif role is not None:
+            projected.append(item)
+    return projected
+
+
+def conversation_view(items: Sequence[TResponseInputItem]) -> list[TResponseInputItem]:
+    """The dialogue with earlier boilerplate and repeats collapsed to placeholders."""
+    latest = max((i for i, item in enumerate(items) if _role(item) == "assistant"), default=-1)
+    projected: list[TResponseInputItem] = []
+    seen: set[str] = set()
+    for index, item in enumerate(items):
+        role = _role(item)
+        text = _text(item)
+        if role == "assistant" and index != latest and len(text) >= _MIN_COLLAPSE_CHARS:
+            placeholder = _collapsed(text, seen)
+            seen.add(text)
+            if placeholder is not None:
+                item = _message("assistant", placeholder)
+        elif role == "user" and text.startswith(_WIDGET_PREFIX):
+            item = _message("user", "[A widget was shown to the user.]")
+        projected.append(item)
+    return projected
+
+
+def estimate_tokens(items: Sequence[TResponseInputItem]) -> int:
+    """Rough prompt size: ~4 characters per token plus per-message framing."""
+    chars = sum(len(_text(item)) if _role(item) else len(orjson.dumps(item)) for item in items)
+    return chars // 4 + 4 * len(items)
+
+
+class ProjectionStats:
+    """Estimated prompt tokens before and after projection, per stage."""
+
+    def __init__(self) -> None:
+        self._stages: dict[str, dict[str, int]] = {}
+
+    def record(
+        self,
+        stage: str,
+        original: Sequence[TResponseInputItem],
+        projected: Sequence[TResponseInputItem],
+    ) -> None:
+        before, after = estimate_tokens(original), estimate_tokens(projected)
+        totals = self._stages.setdefault(stage, {"turns": 0, "tokens_before": 0, "tokens_after": 0})
+        totals["turns"] += 1
+        totals["tokens_before"] += before
+        totals["tokens_after"] += after
+        logger.info(
+            f"Projected {stage} input: ~{before} -> ~{after} tokens (saved ~{before - after})"
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            stage: {**totals, "tokens_saved": totals["tokens_before"] - totals["tokens_after"]}
+            for stage, totals in self._stages.items()
+        }
+
+
+projection_stats = ProjectionStats()
+register_metrics("projection", projection_stats.stats)
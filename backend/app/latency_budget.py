@@ -0,0 +1,154 @@
+"""
+Latency budget with hedged requests for calls on the critical path.
+
+A budgeted call that runs past the learned p95 gets a duplicate (hedged) request and
+whichever finishes first wins. If the hard budget runs out too, ``BudgetExceeded``
+hands the caller a future for the eventual result so it can fall back now and
+reconcile later.
+
+Every attempt is timed from the start of the call, so a hedge that wins includes the
+wait before it was sent. Attempts cancelled before finishing (a losing primary, or
+losers once the budget ran out) are censored: all that is known is that they were
+slow, so they count as taking at least the hard budget. Without them the learned
+quantile would only ever shrink and hedging would fire more and more often.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class BudgetExceeded(Exception, Generic[T]):
+    """Raised when the hard budget runs out; ``pending`` resolves to the late result."""
+
+    def __init__(self, name: str, pending: asyncio.Future[T]) -> None:
+        super().__init__(f"{name} exceeded its latency budget")
+        self.pending = pending
+
+
+class LatencyBudget:
+    """Learns a call's latency distribution and hedges its slow tail."""
+
+    def __init__(
+        self,
+        name: str,
+        hard_budget: float,
+        initial_hedge_after: float,
+        quantile: float = 0.95,
+        window: int = 200,
+        min_samples: int = 20,
+    ) -> None:
+        self.name = name
+        self.hard_budget = hard_budget
+        self._initial_hedge_after = initial_hedge_after
+        self._quantile = quantile
+        self._samples: deque[float] = deque(maxlen=window)
+        self._min_samples = min_samples
+
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_exceeded = 0
+        self.fallbacks = 0
+        self.censored = 0
+
+    def hedge_after(self) -> float:
+        """Seconds to wait before hedging: the learned quantile, once there is enough data."""
+        if len(self._samples) < self._min_samples:
+            return min(self._initial_hedge_after, self.hard_budget)
+        ordered = sorted(self._samples)
+        return min(ordered[int(self._quantile * (len(ordered) - 1))], self.hard_budget)
+
+    async def run(self, factory: Callable[[], Awaitable[T]]) -> T:
+        """Run ``factory()`` within the budget, hedging once past the learned quantile."""
+        self.calls += 1
+        started = time.perf_counter()
+        deadline = started + self.hard_budget
+        primary = self._start(factory, started)
+        tasks = [primary]
+
+        winner = await _race(tasks, self.hedge_after())
+        if winner is None and time.perf_counter() < deadline:
+            self.hedges += 1
+            tasks.append(self._start(factory, started))
+            winner = await _race(tasks, deadline - time.perf_counter())
+
+        if winner is None:
+            self.budget_exceeded += 1
+            raise BudgetExceeded(self.name, asyncio.ensure_future(self._settle(tasks)))
+
+        _cancel_others(tasks, winner)
+        if winner is not primary:
+            self.hedge_wins += 1
+        return winner.result()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedges / self.calls if self.calls else 0.0,
+            "hedge_win_rate": self.hedge_wins / self.hedges if self.hedges else 0.0,
+            "budget_exceeded": self.budget_exceeded,
+            "fallbacks": self.fallbacks,
+            "censored": self.censored,
+            "hedge_after_seconds": self.hedge_after(),
+            "hard_budget_seconds": self.hard_budget,
+        }
+
+    def _start(self, factory: Callable[[], Awaitable[T]], started: float) -> asyncio.Task[T]:
+        async def timed() -> T:
+            try:
+                result = await factory()
+            except asyncio.CancelledError:
+                self.censored += 1
+                self._samples.append(max(time.perf_counter() - started, self.hard_budget))
+                raise
+            self._samples.append(time.perf_counter() - started)
+            return result
+
+        return asyncio.ensure_future(timed())
+
+    async def _settle(self, tasks: list[asyncio.Task[T]]) -> T:
+        winner = await _race(tasks, None)
+        assert winner is not None
+        _cancel_others(tasks, winner)
+        return winner.result()
+
+
+async def _race(tasks: list[asyncio.Task[T]], timeout: float | None) -> asyncio.Task[T] | None:
+    """Return the first task to succeed, the last failure if all fail, or None on timeout."""
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    pending = {task for task in tasks if not task.done()}
+    done = [task for task in tasks if task.done()]
+    while True:
+        for task in done:
+            if not task.cancelled() and task.exception() is None:
+                return task
+        if not pending:
+            return done[-1]
+        remaining = None if deadline is None else deadline - time.perf_counter()
+        if remaining is not None and remaining <= 0:
+            return None
+        finished, pending = await asyncio.wait(
+            pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+        )
+        if not finished:
+            return None
+        done = list(finished)
+
+
+def _cancel_others(tasks: list[asyncio.Task[T]], winner: asyncio.Task[T]) -> None:
+    for task in tasks:
+        if task is winner:
+            continue
+        if task.done():
+            if not task.cancelled():
+                task.exception()  # mark a losing failure as retrieved
+        else:
+            task.cancel()
@@ -2,9 +2,14 @@
 
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
+import re
+import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterable, AsyncIterator
 
 from dotenv import load_dotenv
 
@@ -12,16 +17,89 @@ from dotenv import load_dotenv
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
+import orjson
 from chatkit.server import StreamingResult
+from chatkit.store import NotFoundError
 from fastapi import Depends, FastAPI, HTTPException, Request, status
-from fastapi.responses import Response, StreamingResponse
-from starlette.responses import JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
+from starlette.datastructures import UploadFile
+from starlette.types import Receive, Scope, Send
 
+from .attachment_store import UPLOAD_PATH, AttachmentTooLarge
 from .dorthy_chat import DorthyAssistantServer, create_chatkit_server
+from .memory_store import PARTITION_KEY, partition_of
+from .metrics import metrics_snapshot, register_metrics
+from .rate_limit import STREAMING_OPS, stream_limiter
+from .request_profiler import CONTEXT_KEY, request_profiler
+from .response_cache import response_cache
+from .sse import SSEConfig, SSEWriter
+from .store_snapshot import SnapshotManager
+from .tracing import (
+    configure_tracing,
+    set_attributes,
+    shutdown_tracing,
+    start_span,
+    traced_stream,
+    use_span,
+)
 
-app = FastAPI(title="Dorthy AI - Home Buyer Assistant API")
+logger = logging.getLogger(__name__)
 
+configure_tracing()
 _chatkit_server: DorthyAssistantServer | None = create_chatkit_server()
+_sse_config = SSEConfig.from_env()
+
+# Warm restarts: set STORE_SNAPSHOT_PATH to a persistent volume to keep threads across deploys
+_snapshot_path = os.getenv("STORE_SNAPSHOT_PATH")
+_snapshots: SnapshotManager | None = None
+if _chatkit_server is not None and _snapshot_path:
+    _snapshots = SnapshotManager(
+        _chatkit_server.store,
+        Path(_snapshot_path),
+        interval=float(os.getenv("STORE_SNAPSHOT_INTERVAL_SECONDS", "60")),
+    )
+
+# Threads idle for this long are compressed in memory until they are used again (0 disables)
+_cold_after = float(os.getenv("COLD_THREAD_IDLE_SECONDS", "1800"))
+if _chatkit_server is not None:
+    register_metrics("store", _chatkit_server.store.residency)
+    register_metrics("reports", _chatkit_server.reports.stats)
+    register_metrics("attachments", _chatkit_server.attachments.stats)
+
+
+async def _freeze_idle_threads(server: DorthyAssistantServer) -> None:
+    while True:
+        await asyncio.sleep(max(_cold_after / 4, 1.0))
+        frozen = 0
+        # Small batches so compressing a large backlog never stalls live streams.
+        while count := server.store.freeze_idle(_cold_after, limit=100):
+            frozen += count
+            await asyncio.sleep(0)
+        if frozen:
+            logger.info(f"Compressed {frozen} idle threads")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    if _snapshots is not None:
+        _snapshots.restore()
+        _snapshots.start()
+    sweeper = None
+    if _chatkit_server is not None:
+        await _chatkit_server.reports.start()
+        if _cold_after > 0:
+            sweeper = asyncio.create_task(_freeze_idle_threads(_chatkit_server))
+    yield
+    if sweeper is not None:
+        sweeper.cancel()
+    if _chatkit_server is not None:
+        await _chatkit_server.reports.stop()
+    if _snapshots is not None:
+        await _snapshots.stop()
+    shutdown_tracing()
+
+
+app = FastAPI(title="Dorthy AI - Home Buyer Assistant API", lifespan=lifespan)
 
 
 def get_chatkit_server() -> DorthyAssistantServer:
@@ -36,20 +114,235 @@ def get_chatkit_server() -> DorthyAssistantServer:
     return _chatkit_server
 
 
+# Random per-browser id sent by the frontend; threads are partitioned by it
+SESSION_HEADER = "x-dorthy-session"
+_SESSION = re.compile(r"^[\w-]{16,128}$")
+
+
+def request_partition(request: Request) -> str:
+    """Store partition for the request.
+
+    Thread and attachment routes require a session: without one every such request
+    would land in the same shared partition and could read the others' threads.
+    """
+    session = request.headers.get(SESSION_HEADER)
+    if session is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Missing X-Dorthy-Session header"
+        )
+    if not _SESSION.match(session):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid session")
+    return session
+
+
+def _request_type(payload: bytes) -> str | None:
+    try:
+        request = orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        return None
+    return request.get("type") if isinstance(request, dict) else None
+
+
+class _SlotStreamingResponse(StreamingResponse):
+    """Releases the client's stream slot when the response ends, even if it never started.
+
+    Releasing from the body generator is not enough: a client that disconnects before
+    the body is iterated never runs the generator, and its slot would stay taken.
+    """
+
+    def __init__(self, content: AsyncIterable[bytes], client: str | None, **kwargs: Any) -> None:
+        super().__init__(content, **kwargs)
+        self._client = client
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self._client is not None:
+                stream_limiter.release(self._client)
+
+
 @app.post("/chatkit")
 async def chatkit_endpoint(
-    request: Request, server: DorthyAssistantServer = Depends(get_chatkit_server)
+    request: Request,
+    server: DorthyAssistantServer = Depends(get_chatkit_server),
+    partition: str = Depends(request_partition),
 ) -> Response:
-    payload = await request.body()
-    result = await server.process(payload, {"request": request})
-    if isinstance(result, StreamingResult):
-        return StreamingResponse(result, media_type="text/event-stream")
-    if hasattr(result, "json"):
-        return Response(content=result.json, media_type="application/json")
-    return JSONResponse(result)
+    request_span = start_span("POST /chatkit", route="/chatkit")
+    context: dict[str, Any] = {"request": request, PARTITION_KEY: partition}
+    # Opt-in profiling (admin header or sampling); streams finish their profile when done
+    profile = request_profiler.start(request.headers)
+    if profile is not None:
+        profile.watch(sys._getframe())
+        context[CONTEXT_KEY] = profile
+    streaming = False
+    limited_client: str | None = None
+    with use_span(request_span):
+        try:
+            payload = await request.body()
+            op = _request_type(payload)
+            set_attributes(request_span, op=op)
+
+            # New turns hold a stream slot until the response ends; shed load up front
+            if op in STREAMING_OPS:
+                peer = request.client.host if request.client else None
+                client = stream_limiter.client(request.headers, peer, session=partition)
+                rejection = stream_limiter.acquire(client)
+                if rejection is not None:
+                    set_attributes(request_span, limited=rejection.reason)
+                    raise HTTPException(
+                        status_code=rejection.status_code,
+                        detail="Too many requests; please retry shortly.",
+                        headers={"Retry-After": str(rejection.retry_after)},
+                    )
+                limited_client = client
+
+            # Repeated thread / item reads: answer from the ETag or the response cache
+            lookup = response_cache.lookup(payload, server.store, partition_of(context))
+            if lookup is not None:
+                headers = {"ETag": lookup.etag, "Cache-Control": "private, no-cache"}
+                if request.headers.get("if-none-match") == lookup.etag:
+                    response_cache.not_modified += 1
+                    set_attributes(request_span, cache="not_modified")
+                    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+                if lookup.body is not None:
+                    response_cache.hits += 1
+                    set_attributes(request_span, cache="hit")
+                    return Response(
+                        content=lookup.body, media_type="application/json", headers=headers
+                    )
+                response_cache.misses += 1
+
+            try:
+                result = await server.process(payload, context)
+            except AttachmentTooLarge as e:
+                # attachments.create for a file over ATTACHMENT_MAX_BYTES
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)
+                )
+            if isinstance(result, StreamingResult):
+                gzip = _sse_config.compress and "gzip" in request.headers.get("accept-encoding", "")
+                writer = SSEWriter(result, _sse_config, gzip=gzip)
+                body = writer if profile is None else request_profiler.stream(profile, writer)
+                # The request span, profile and stream slot end when the stream does
+                response = _SlotStreamingResponse(
+                    traced_stream(request_span, body),
+                    limited_client,
+                    media_type="text/event-stream",
+                    headers=writer.headers,
+                )
+                streaming = True
+                return response
+            if hasattr(result, "json"):
+                if lookup is not None:
+                    response_cache.put(lookup, result.json, server.store)
+                    return Response(
+                        content=result.json, media_type="application/json", headers=headers
+                    )
+                return Response(content=result.json, media_type="application/json")
+            return ORJSONResponse(result)
+        finally:
+            if not streaming:
+                request_span.end()
+                if profile is not None:
+                    request_profiler.finish(profile)
+                if limited_client is not None:
+                    stream_limiter.release(limited_client)
+
+
+async def _form_file(upload: UploadFile, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+
+@app.api_route(UPLOAD_PATH, methods=["POST", "PUT"])
+async def upload_attachment(
+    attachment_id: str,
+    token: str,
+    request: Request,
+    server: DorthyAssistantServer = Depends(get_chatkit_server),
+) -> dict[str, Any]:
+    """Second phase of an upload: the file, as the raw body or a multipart ``file`` field."""
+    chunks: AsyncIterable[bytes]
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        # Starlette spools the part to a temp file past 1 MB, so memory stays bounded
+        form = await request.form(max_files=1, max_fields=10)
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing file")
+        chunks = _form_file(upload)
+    else:
+        chunks = request.stream()
+    try:
+        attachment = await server.attachments.ingest(attachment_id, token, chunks)
+    except NotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    return attachment.model_dump(mode="json")
+
+
+@app.get("/chatkit/attachments/{attachment_id}")
+async def download_attachment(
+    attachment_id: str,
+    server: DorthyAssistantServer = Depends(get_chatkit_server),
+    partition: str = Depends(request_partition),
+) -> FileResponse:
+    """An uploaded file, sent from disk without reading it into memory."""
+    try:
+        attachment = server.attachments.load(attachment_id, {PARTITION_KEY: partition})
+        path = server.attachments.path(attachment_id, {PARTITION_KEY: partition})
+    except NotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return FileResponse(path, media_type=attachment.mime_type, filename=attachment.name)
 
 
 @app.get("/health")
 async def health_check() -> dict[str, str]:
     """Health check endpoint."""
     return {"status": "healthy", "service": "dorthy-ai"}
+
+
+@app.get("/reports/{job_id}")
+async def get_report(
+    job_id: str,
+    wait: float = 0,
+    server: DorthyAssistantServer = Depends(get_chatkit_server),
+    partition: str = Depends(request_partition),
+) -> dict[str, Any]:
+    """Status of a detailed-report job; ``wait`` long-polls up to 30 s for completion."""
+    # Ownership first, so nobody can hold a connection open on another session's job
+    job = await server.reports.get(job_id)
+    if job is None or partition_of(job.payload) != partition_of({PARTITION_KEY: partition}):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if wait > 0 and not job.done:
+        job = await server.reports.wait(job_id, timeout=min(wait, 30.0)) or job
+    return job.summary()
+
+
+def require_profile_admin(request: Request) -> None:
+    if not request_profiler.authorized(request.headers):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+
+@app.get("/metrics", dependencies=[Depends(require_profile_admin)])
+async def metrics() -> dict[str, Any]:
+    """Process-local performance counters (routing hedges, fallbacks, ...)."""
+    return metrics_snapshot()
+
+
+@app.get("/profiles", dependencies=[Depends(require_profile_admin)])
+async def list_profiles() -> list[dict[str, Any]]:
+    """Recent request profiles, newest first."""
+    return request_profiler.recent()
+
+
+@app.get("/profiles/{name}", dependencies=[Depends(require_profile_admin)])
+async def get_profile(name: str) -> FileResponse:
+    """Folded stacks for one profile (feed to flamegraph.pl or speedscope)."""
+    path = request_profiler.path(name)
+    if path is None or not path.exists():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return FileResponse(path, media_type="text/plain")
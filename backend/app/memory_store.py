@@ -1,30 +1,212 @@
 """
 Simple in-memory store compatible with the ChatKit Store interface.
 A production app would implement this using a persistant database.
+
+Threads are partitioned by the session key the endpoint puts in the request context
+(``context["partition"]``). Each partition keeps its own creation-ordered index, so
+listing costs O(that session's threads), and threads in another partition read as
+not found.
 """
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import bisect
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
 
 from chatkit.store import NotFoundError, Store
 from chatkit.types import Attachment, Page, Thread, ThreadItem, ThreadMetadata
 
+from .cold_thread import DEFAULT_PARTITION, ColdThread
+from .store_snapshot import SnapshotRecord, created_key
+
+if TYPE_CHECKING:
+    from .attachment_store import LocalAttachmentStore
+
+PARTITION_KEY = "partition"
+
 
-@dataclass
+def partition_of(context: dict[str, Any]) -> str:
+    """Partition a request's threads belong to; requests without a key share the default."""
+    return context.get(PARTITION_KEY) or DEFAULT_PARTITION
+
+
+@dataclass(slots=True)
 class _ThreadState:
     thread: ThreadMetadata
     items: List[ThreadItem]
+    partition: str = DEFAULT_PARTITION
+    version: int = 0
+    last_access: float = field(default_factory=time.monotonic)
+
+
+@dataclass(slots=True)
+class _Partition:
+    """One partition's threads as (created_key, thread_id), sorted ascending."""
+
+    index: List[Tuple[float, str]] = field(default_factory=list)
+    keys: Dict[str, float] = field(default_factory=dict)
+    # Clock value of the last change to this partition's thread list
+    version: int = 0
+
+    def add(self, thread_id: str, key: float) -> None:
+        if self.keys.get(thread_id) == key:
+            return
+        self.discard(thread_id)
+        self.keys[thread_id] = key
+        bisect.insort(self.index, (key, thread_id))
+
+    def discard(self, thread_id: str) -> None:
+        key = self.keys.pop(thread_id, None)
+        if key is not None:
+            del self.index[bisect.bisect_left(self.index, (key, thread_id))]
+
+    def page(self, after: str | None, limit: int, order: str) -> tuple[List[str], bool]:
+        """Thread ids following ``after`` in ``order``, and whether more remain."""
+        cursor = (self.keys[after], after) if after is not None and after in self.keys else None
+        if order == "desc":
+            end = bisect.bisect_left(self.index, cursor) if cursor else len(self.index)
+            window = self.index[max(end - limit - 1, 0) : end][::-1]
+        else:
+            start = bisect.bisect_right(self.index, cursor) if cursor else 0
+            window = self.index[start : start + limit + 1]
+        return [thread_id for _, thread_id in window[:limit]], len(window) > limit
 
 
 class MemoryStore(Store[dict[str, Any]]):
     """Simple in-memory store compatible with the ChatKit Store interface."""
 
-    def __init__(self) -> None:
+    def __init__(self, attachments: LocalAttachmentStore | None = None) -> None:
         self._threads: Dict[str, _ThreadState] = {}
-        # Attachments intentionally unsupported; use a real store that enforces auth.
+        # Idle threads and threads restored from a snapshot, kept as compressed blobs
+        # and decoded on first access.
+        self._cold: Dict[str, ColdThread] = {}
+        self._partitions: Dict[str, _Partition] = {}
+        # Monotonic change clock; thread and partition list versions are clock values.
+        self._clock = 0
+        # Attachment metadata and files live in the attachment store, if one is configured
+        self._attachments = attachments
+
+    # -- Versions --------------------------------------------------------
+    def _touch(self, state: _ThreadState, *, listing: bool = False) -> None:
+        self._clock += 1
+        state.version = self._clock
+        if listing:
+            self._partitions[state.partition].version = self._clock
+
+    @property
+    def clock(self) -> int:
+        return self._clock
+
+    def thread_version(self, thread_id: str, partition: str) -> int | None:
+        """Version of a thread and its items, or None if ``partition`` has no such thread."""
+        state = self._threads.get(thread_id) or self._cold.get(thread_id)
+        return state.version if state and state.partition == partition else None
+
+    def list_version(self, partition: str) -> int:
+        """Version of a partition's thread list (any thread metadata change bumps it)."""
+        entry = self._partitions.get(partition)
+        # Partitions are dropped once empty; 0 always stands for an empty list.
+        return entry.version if entry else 0
+
+    # -- Snapshots -------------------------------------------------------
+    def attach_snapshot(self, entries: list[ColdThread]) -> None:
+        """Register snapshot entries as cold threads without decoding them."""
+        for entry in entries:
+            if entry.thread_id not in self._threads:
+                self._cold[entry.thread_id] = entry
+                self._index(entry.partition).add(entry.thread_id, entry.created_key)
+                self._clock = max(self._clock, entry.version)
+        for partition in self._partitions.values():
+            partition.version = self._clock
+
+    def snapshot_records(self) -> list[SnapshotRecord | ColdThread]:
+        """Capture every thread for a snapshot; cheap enough to run on the event loop.
+
+        Stored models are replaced rather than mutated, so the captured references
+        stay consistent while a worker thread encodes them.
+        """
+        records: list[SnapshotRecord | ColdThread] = list(self._cold.values())
+        records.extend(
+            SnapshotRecord(
+                thread_id,
+                created_key(state.thread.created_at),
+                state.version,
+                state.thread,
+                list(state.items),
+                state.partition,
+            )
+            for thread_id, state in self._threads.items()
+        )
+        return records
+
+    # -- Cold threads ----------------------------------------------------
+    def freeze_idle(self, idle_seconds: float, limit: int | None = None) -> int:
+        """Compress threads not accessed for ``idle_seconds``; returns how many were frozen."""
+        cutoff = time.monotonic() - idle_seconds
+        idle = [tid for tid, state in self._threads.items() if state.last_access <= cutoff]
+        idle = idle[:limit]
+        for thread_id in idle:
+            state = self._threads.pop(thread_id)
+            self._cold[thread_id] = ColdThread.freeze(
+                state.thread,
+                state.items,
+                created_key(state.thread.created_at),
+                state.version,
+                state.partition,
+            )
+        return len(idle)
+
+    def residency(self) -> dict[str, int]:
+        return {
+            "hot_threads": len(self._threads),
+            "cold_threads": len(self._cold),
+            "cold_bytes": sum(entry.nbytes() for entry in self._cold.values()),
+            "partitions": len(self._partitions),
+        }
+
+    # -- Partitions ------------------------------------------------------
+    def _index(self, partition: str) -> _Partition:
+        entry = self._partitions.get(partition)
+        if entry is None:
+            entry = self._partitions[partition] = _Partition()
+        return entry
+
+    def _unindex(self, partition: str, thread_id: str) -> None:
+        entry = self._partitions.get(partition)
+        if entry is None:
+            return
+        entry.discard(thread_id)
+        if not entry.keys:
+            del self._partitions[partition]
+
+    def _state(self, thread_id: str, context: dict[str, Any]) -> _ThreadState | None:
+        """Hydrated state of a thread in the caller's partition, or None."""
+        state = self._threads.get(thread_id)
+        if state is None:
+            entry = self._cold.get(thread_id)
+            if entry is None or entry.partition != partition_of(context):
+                return None
+            del self._cold[thread_id]
+            state = _ThreadState(
+                thread=entry.metadata(),
+                items=entry.items(),
+                partition=entry.partition,
+                version=entry.version,
+            )
+            self._threads[thread_id] = state
+        elif state.partition != partition_of(context):
+            return None
+        state.last_access = time.monotonic()
+        return state
+
+    def _check_owner(self, thread_id: str, context: dict[str, Any]) -> None:
+        """Treat a thread from another partition as missing rather than shadowing it."""
+        state = self._threads.get(thread_id) or self._cold.get(thread_id)
+        if state is not None and state.partition != partition_of(context):
+            raise NotFoundError(f"Thread {thread_id} not found")
 
     @staticmethod
     def _coerce_thread_metadata(thread: ThreadMetadata | Thread) -> ThreadMetadata:
@@ -41,21 +223,30 @@ class MemoryStore(Store[dict[str, Any]]):
 
     # -- Thread metadata -------------------------------------------------
     async def load_thread(self, thread_id: str, context: dict[str, Any]) -> ThreadMetadata:
+        partition = partition_of(context)
         state = self._threads.get(thread_id)
-        if not state:
-            raise NotFoundError(f"Thread {thread_id} not found")
-        return self._coerce_thread_metadata(state.thread)
+        if state and state.partition == partition:
+            return self._coerce_thread_metadata(state.thread)
+        entry = self._cold.get(thread_id)
+        if entry and entry.partition == partition:
+            return entry.metadata()
+        raise NotFoundError(f"Thread {thread_id} not found")
 
     async def save_thread(self, thread: ThreadMetadata, context: dict[str, Any]) -> None:
+        self._check_owner(thread.id, context)
         metadata = self._coerce_thread_metadata(thread)
-        state = self._threads.get(thread.id)
+        state = self._state(thread.id, context)
         if state:
             state.thread = metadata
         else:
-            self._threads[thread.id] = _ThreadState(
+            state = _ThreadState(
                 thread=metadata,
                 items=[],
+                partition=partition_of(context),
             )
+            self._threads[thread.id] = state
+        self._index(state.partition).add(thread.id, created_key(metadata.created_at))
+        self._touch(state, listing=True)
 
     async def load_threads(
         self,
@@ -64,44 +255,46 @@ class MemoryStore(Store[dict[str, Any]]):
         order: str,
         context: dict[str, Any],
     ) -> Page[ThreadMetadata]:
-        threads = sorted(
-            (self._coerce_thread_metadata(state.thread) for state in self._threads.values()),
-            key=lambda t: t.created_at or datetime.min,
-            reverse=(order == "desc"),
-        )
-
-        if after:
-            index_map = {thread.id: idx for idx, thread in enumerate(threads)}
-            start = index_map.get(after, -1) + 1
-        else:
-            start = 0
-
-        slice_threads = threads[start : start + limit + 1]
-        has_more = len(slice_threads) > limit
-        slice_threads = slice_threads[:limit]
-        next_after = slice_threads[-1].id if has_more and slice_threads else None
+        # Page through the partition's ordered index; only the returned page is decoded.
+        partition = self._partitions.get(partition_of(context))
+        if partition is None:
+            return Page(data=[], has_more=False, after=None)
+        slice_ids, has_more = partition.page(after, limit, order)
+        next_after = slice_ids[-1] if has_more and slice_ids else None
         return Page(
-            data=slice_threads,
+            data=[await self.load_thread(thread_id, context) for thread_id in slice_ids],
             has_more=has_more,
             after=next_after,
         )
 
     async def delete_thread(self, thread_id: str, context: dict[str, Any]) -> None:
+        partition = partition_of(context)
+        state = self._threads.get(thread_id) or self._cold.get(thread_id)
+        if state is None or state.partition != partition:
+            return
         self._threads.pop(thread_id, None)
+        self._cold.pop(thread_id, None)
+        self._clock += 1
+        self._index(partition).version = self._clock
+        self._unindex(partition, thread_id)
 
     # -- Thread items ----------------------------------------------------
-    def _thread_state(self, thread_id: str) -> _ThreadState:
-        state = self._threads.get(thread_id)
+    def _thread_state(self, thread_id: str, context: dict[str, Any]) -> _ThreadState:
+        self._check_owner(thread_id, context)
+        state = self._state(thread_id, context)
         if state is None:
             state = _ThreadState(
                 thread=ThreadMetadata(id=thread_id, created_at=datetime.utcnow()),
                 items=[],
+                partition=partition_of(context),
             )
             self._threads[thread_id] = state
+            self._index(state.partition).add(thread_id, created_key(state.thread.created_at))
+            self._touch(state, listing=True)
         return state
 
-    def _items(self, thread_id: str) -> List[ThreadItem]:
-        state = self._thread_state(thread_id)
+    def _items(self, thread_id: str, context: dict[str, Any]) -> List[ThreadItem]:
+        state = self._thread_state(thread_id, context)
         return state.items
 
     async def load_thread_items(
@@ -112,8 +305,9 @@ class MemoryStore(Store[dict[str, Any]]):
         order: str,
         context: dict[str, Any],
     ) -> Page[ThreadItem]:
-        items = [item.model_copy(deep=True) for item in self._items(thread_id)]
-        items.sort(
+        # Sort and slice the stored items first so only the returned page is copied.
+        items = sorted(
+            self._items(thread_id, context),
             key=lambda item: getattr(item, "created_at", datetime.utcnow()),
             reverse=(order == "desc"),
         )
@@ -128,15 +322,23 @@ class MemoryStore(Store[dict[str, Any]]):
         has_more = len(slice_items) > limit
         slice_items = slice_items[:limit]
         next_after = slice_items[-1].id if has_more and slice_items else None
-        return Page(data=slice_items, has_more=has_more, after=next_after)
+        return Page(
+            data=[item.model_copy(deep=True) for item in slice_items],
+            has_more=has_more,
+            after=next_after,
+        )
 
     async def add_thread_item(
         self, thread_id: str, item: ThreadItem, context: dict[str, Any]
     ) -> None:
-        self._items(thread_id).append(item.model_copy(deep=True))
+        state = self._thread_state(thread_id, context)
+        state.items.append(item.model_copy(deep=True))
+        self._touch(state)
 
     async def save_item(self, thread_id: str, item: ThreadItem, context: dict[str, Any]) -> None:
-        items = self._items(thread_id)
+        state = self._thread_state(thread_id, context)
+        items = state.items
+        self._touch(state)
         for idx, existing in enumerate(items):
             if existing.id == item.id:
                 items[idx] = item.model_copy(deep=True)
@@ -144,7 +346,7 @@ class MemoryStore(Store[dict[str, Any]]):
         items.append(item.model_copy(deep=True))
 
     async def load_item(self, thread_id: str, item_id: str, context: dict[str, Any]) -> ThreadItem:
-        for item in self._items(thread_id):
+        for item in self._items(thread_id, context):
             if item.id == item_id:
                 return item.model_copy(deep=True)
         raise NotFoundError(f"Item {item_id} not found")
@@ -152,33 +354,34 @@ class MemoryStore(Store[dict[str, Any]]):
     async def delete_thread_item(
         self, thread_id: str, item_id: str, context: dict[str, Any]
     ) -> None:
-        items = self._items(thread_id)
-        self._threads[thread_id].items = [item for item in items if item.id != item_id]
+        state = self._thread_state(thread_id, context)
+        state.items = [item for item in state.items if item.id != item_id]
+        self._touch(state)
 
     # -- Files -----------------------------------------------------------
-    # These methods are not currently used but required to be compatible with the Store interface.
+    # Metadata is kept by the attachment store, scoped to the creating partition.
+
+    def _attachment_store(self) -> LocalAttachmentStore:
+        if self._attachments is None:
+            raise NotImplementedError(
+                "MemoryStore has no attachment store; pass one to enable uploads."
+            )
+        return self._attachments
 
     async def save_attachment(
         self,
         attachment: Attachment,
         context: dict[str, Any],
     ) -> None:
-        raise NotImplementedError(
-            "MemoryStore does not persist attachments. Provide a Store implementation "
-            "that enforces authentication and authorization before enabling uploads."
-        )
+        self._attachment_store().update(attachment, context)
 
     async def load_attachment(
         self,
         attachment_id: str,
         context: dict[str, Any],
     ) -> Attachment:
-        raise NotImplementedError(
-            "MemoryStore does not load attachments. Provide a Store implementation "
-            "that enforces authentication and authorization before enabling uploads."
-        )
+        return self._attachment_store().load(attachment_id, context)
 
     async def delete_attachment(self, attachment_id: str, context: dict[str, Any]) -> None:
-        raise NotImplementedError(
-            "MemoryStore does not delete attachments because they are never stored."
-        )
+        # Normally already gone: the server deletes through the attachment store first.
+        await self._attachment_store().delete_attachment(attachment_id, context)
@@ -0,0 +1,18 @@
+"""Process-local metrics registry exported by the ``/metrics`` endpoint."""
+
+from __future__ import annotations
+
+from typing import Any, Callable
+
+MetricsProvider = Callable[[], dict[str, Any]]
+
+_providers: dict[str, MetricsProvider] = {}
+
+
+def register_metrics(name: str, provider: MetricsProvider) -> None:
+    """Expose ``provider()`` under ``name`` in the metrics snapshot."""
+    _providers[name] = provider
+
+
+def metrics_snapshot() -> dict[str, Any]:
+    return {name: provider() for name, provider in _providers.items()}
@@ -0,0 +1,118 @@
+"""
+Predictive prefetch of program documents for the program teaser.
+
+When the completeness check shows only a couple of required fields left, the next
+turn will most likely route to the teaser. We start retrieving program passages for
+the candidate programs in the background and store them in the thread metadata, so
+the teaser can start streaming with grounded context already in place. Passages
+come only from the program shards matching the buyer's province and municipality.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Any, Sequence
+
+from chatkit.store import Store
+from chatkit.types import ThreadMetadata
+
+from .dorthy_agent import CompletnessCheckSchema, missing_required_fields
+from .program_rules import program_matcher
+from .program_shards import ShardRegistry, program_shards, shards_for
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_METADATA_KEY = "program_context"
+
+
+class ProgramPrefetcher:
+    """Runs at most one background retrieval per thread and caches it on the thread."""
+
+    def __init__(
+        self,
+        shards: ShardRegistry,
+        max_missing_fields: int = 2,
+        results_per_program: int = 2,
+        max_chars_per_program: int = 800,
+    ) -> None:
+        self._shards = shards
+        self._max_missing_fields = max_missing_fields
+        self._results_per_program = results_per_program
+        self._max_chars_per_program = max_chars_per_program
+        self._inflight: dict[str, asyncio.Task[None]] = {}
+
+    def schedule(
+        self,
+        thread: ThreadMetadata,
+        profile: CompletnessCheckSchema,
+        store: Store[Any],
+        context: Any,
+    ) -> bool:
+        """Start a prefetch if the profile is nearly complete; return whether one started."""
+        missing = missing_required_fields(profile)
+        if not 0 < len(missing) <= self._max_missing_fields or thread.id in self._inflight:
+            return False
+
+        report = program_matcher.match(profile)
+        candidates = [entry.program.name for entry in report.matches + report.needs_info]
+        shards = self._shards.resolve(shards_for(profile))
+        cached = thread.metadata.get(PREFETCH_METADATA_KEY) or {}
+        if cached.get("shards") != shards:
+            # The buyer moved to other shards; passages from the old ones don't apply
+            cached = {}
+        if not candidates or set(candidates) <= set(cached.get("passages", {})):
+            return False
+
+        logger.info(
+            f"Prefetching {len(candidates)} programs from shards {shards} for thread {thread.id}"
+        )
+        task = asyncio.create_task(self._prefetch(thread, candidates, shards, store, context))
+        self._inflight[thread.id] = task
+        task.add_done_callback(lambda _: self._inflight.pop(thread.id, None))
+        return True
+
+    async def _prefetch(
+        self,
+        thread: ThreadMetadata,
+        programs: Sequence[str],
+        shards: list[str],
+        store: Store[Any],
+        context: Any,
+    ) -> None:
+        try:
+            passages = await asyncio.gather(
+                *(self._search(shards, program) for program in programs)
+            )
+            cached = thread.metadata.get(PREFETCH_METADATA_KEY) or {}
+            previous = cached.get("passages", {}) if cached.get("shards") == shards else {}
+            merged = {**previous, **dict(zip(programs, passages))}
+            # Mutate the live thread so the server's own save at the end of the stream
+            # keeps the prefetched context instead of overwriting it.
+            thread.metadata[PREFETCH_METADATA_KEY] = {"passages": merged, "shards": shards}
+            await store.save_thread(thread, context)
+        except Exception as e:
+            logger.warning(f"Program prefetch failed for thread {thread.id}: {e}")
+
+    async def _search(self, shards: Sequence[str], program: str) -> str:
+        passages = await self._shards.search(shards, program, self._results_per_program)
+        text = "\n".join(passage.text for passage in passages)
+        return text[: self._max_chars_per_program]
+
+
+def prefetched_context(thread: ThreadMetadata | None, programs: Sequence[str]) -> str | None:
+    """Return cached program passages for ``programs`` as prompt text, if any were prefetched."""
+    if thread is None:
+        return None
+    passages = (thread.metadata.get(PREFETCH_METADATA_KEY) or {}).get("passages", {})
+    sections = [f"### {name}\n{passages[name]}" for name in programs if passages.get(name)]
+    if not sections:
+        return None
+    return "Program document excerpts (for wording only):\n\n" + "\n\n".join(sections)
+
+
+program_prefetcher = ProgramPrefetcher(
+    program_shards,
+    max_missing_fields=int(os.getenv("PREFETCH_MAX_MISSING_FIELDS", "2")),
+)
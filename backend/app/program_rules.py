@@ -0,0 +1,422 @@
+"""
+Deterministic program eligibility rules for Dorthy's program teaser.
+
+Program criteria are compiled once into per-dimension bitsets (one bit per rule row),
+so matching a profile is a handful of dictionary lookups and integer ANDs regardless
+of how many programs are in the table. The teaser agent only writes prose around
+the resulting match / needs-info / no-fit lists.
+
+The table is loaded from ``programs.json``, where every entry names the document it
+was taken from and the date it was last checked against it. Entries never checked,
+or not checked for ``PROGRAMS_REVIEW_DAYS``, are marked unverified in the prompt so
+the teaser confirms them in the program documents before quoting them.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterable, Mapping, Sequence
+
+import orjson
+
+from .dorthy_agent import CompletnessCheckSchema
+
+logger = logging.getLogger(__name__)
+
+# -- Dimensions ----------------------------------------------------------------
+# Every dimension has a closed set of normalized values. A profile value that cannot
+# be normalized is treated as unknown, which turns constrained programs into
+# "needs more info" rather than "not a fit".
+
+REGIONS = (
+    "toronto",
+    "peel",
+    "york",
+    "durham",
+    "halton",
+    "niagara",
+    "ottawa",
+    "other_on",
+    "outside_on",
+)
+YES_NO = ("yes", "no")
+CITIZENSHIP = ("citizen", "permanent_resident", "other")
+INCOME_BANDS = ("under_50k", "50_80k", "80_120k", "120_200k", "over_200k")
+DOWN_PAYMENT_BANDS = ("under_5", "5_10", "10_20", "over_20")
+CREDIT_BANDS = ("under_600", "600_659", "660_724", "725_759", "760_plus")
+PROPERTY_TYPES = ("resale", "new_construction", "either")
+
+DIMENSIONS: dict[str, tuple[str, ...]] = {
+    "region": REGIONS,
+    "age_18_plus": YES_NO,
+    "citizenship": CITIZENSHIP,
+    "first_time": YES_NO,
+    "income": INCOME_BANDS,
+    "down_payment": DOWN_PAYMENT_BANDS,
+    "credit": CREDIT_BANDS,
+    "disability": YES_NO,
+    "prior_ltt_rebate": YES_NO,
+    "occupancy": YES_NO,
+    "property_type": PROPERTY_TYPES,
+}
+
+DIMENSION_LABELS = {
+    "region": "where you plan to buy",
+    "age_18_plus": "whether you are 18 or older",
+    "citizenship": "citizenship or residency status",
+    "first_time": "first-time buyer status",
+    "income": "household income range",
+    "down_payment": "down payment saved",
+    "credit": "credit score range",
+    "disability": "Disability Tax Credit eligibility",
+    "prior_ltt_rebate": "whether you've claimed a land transfer tax rebate before",
+    "occupancy": "whether you'll move in within 9 months",
+    "property_type": "resale vs. new construction",
+}
+
+
+@dataclass(frozen=True)
+class Program:
+    """A program and the alternative rule rows under which someone may qualify.
+
+    Each row maps a dimension to its allowed values; dimensions missing from a row
+    are unconstrained. A profile fits the program when any row fits.
+    """
+
+    name: str
+    summary: str
+    criteria: tuple[str, ...]
+    rows: tuple[Mapping[str, frozenset[str]], ...]
+    # The document the entry was taken from, and when it was last checked against it
+    source: str = ""
+    verified: date | None = None
+
+    def needs_review(self, today: date | None = None) -> bool:
+        if self.verified is None:
+            return True
+        return (today or date.today()) - self.verified > REVIEW_AFTER
+
+
+def _row(**allowed: Iterable[str]) -> Mapping[str, frozenset[str]]:
+    for dim, values in allowed.items():
+        unknown = set(values) - set(DIMENSIONS[dim])
+        if unknown:
+            raise ValueError(f"Unknown {dim} values: {sorted(unknown)}")
+    return {dim: frozenset(values) for dim, values in allowed.items()}
+
+
+# Where each program's amounts and criteria come from and when they were last checked
+# against that source. Edit programs.json, not the code, when a program changes.
+PROGRAMS_PATH = Path(__file__).with_name("programs.json")
+
+# Entries unchecked for longer than this are flagged for the teaser to confirm
+REVIEW_AFTER = timedelta(days=int(os.getenv("PROGRAMS_REVIEW_DAYS", "365")))
+
+
+def load_programs(path: Path = PROGRAMS_PATH) -> tuple[Program, ...]:
+    """Read the program table; every entry must name its source document."""
+    programs = []
+    for entry in orjson.loads(path.read_bytes())["programs"]:
+        if not entry.get("source"):
+            raise ValueError(f"Program {entry['name']!r} in {path.name} has no source")
+        verified = entry.get("verified")
+        programs.append(
+            Program(
+                name=entry["name"],
+                summary=entry["summary"],
+                criteria=tuple(entry["criteria"]),
+                rows=tuple(_row(**row) for row in entry["rows"]),
+                source=entry["source"],
+                verified=date.fromisoformat(verified) if verified else None,
+            )
+        )
+    unreviewed = [program.name for program in programs if program.needs_review()]
+    if unreviewed:
+        logger.warning(
+            f"{len(unreviewed)} of {len(programs)} programs in {path.name} are unverified or "
+            f"last checked over {REVIEW_AFTER.days} days ago: {', '.join(unreviewed)}"
+        )
+    return tuple(programs)
+
+
+PROGRAMS = load_programs()
+
+
+# -- Profile normalization -----------------------------------------------------
+
+# Municipal regions we know, by province code; only Ontario's are classified so far
+_REGION_KEYWORDS: dict[str, tuple[tuple[str, tuple[str, ...]], ...]] = {
+    "ON": (
+        ("toronto", ("toronto", "scarborough", "etobicoke", "north york", "east york", "gta core")),
+        ("peel", ("peel", "brampton", "mississauga", "caledon")),
+        ("york", ("york", "markham", "vaughan", "richmond hill", "newmarket", "aurora")),
+        ("durham", ("durham", "oshawa", "whitby", "ajax", "pickering", "clarington")),
+        ("halton", ("halton", "oakville", "burlington", "milton", "halton hills")),
+        ("niagara", ("niagara", "st. catharines", "st catharines", "welland", "grimsby")),
+        ("ottawa", ("ottawa", "kanata", "nepean", "orleans")),
+    ),
+}
+
+# Whole words only, so "Hamilton" is not read as "milton"
+_REGION_PATTERNS = {
+    province: tuple(
+        (region, re.compile(r"\b(?:" + "|".join(map(re.escape, keywords)) + r")\b"))
+        for region, keywords in regions
+    )
+    for province, regions in _REGION_KEYWORDS.items()
+}
+# A negation shortly before a keyword in the same clause: "not a first-time", "never owned"
+_NEGATION = r"(?:\b(?:not|never|no)|n't)\b[\w\s'-]{0,20}?"
+_FIRST = re.compile(r"\bfirst\b")
+_NOT_FIRST = re.compile(_NEGATION + r"\bfirst\b")
+_OWNED = re.compile(r"\bown(?:ed|er|s)?\b")
+_NOT_OWNED = re.compile(_NEGATION + r"\bown(?:ed|er|s)?\b")
+_NUMBER = re.compile(r"(\d+(?:\.\d+)?)\s*(k|%)?", re.IGNORECASE)
+_BELOW = ("under", "below", "less", "<")
+_UNSURE = ("not sure", "unsure", "don't know", "dont know", "unknown")
+
+
+def _text(value: str) -> str:
+    return value.strip().lower()
+
+
+def _yes_no(value: str) -> str | None:
+    text = _text(value)
+    if not text or any(marker in text for marker in _UNSURE):
+        return None
+    if text.startswith(("no", "n/a", "never", "not", "false")) or text in {"n", "none"}:
+        return "no"
+    if text.startswith(("yes", "y", "true", "sure", "definitely", "probably")):
+        return "yes"
+    return None
+
+
+def _band(value: str, edges: Sequence[float], labels: Sequence[str]) -> str | None:
+    """Map free text like "$50–80K" or "under 5%" onto ``labels``.
+
+    ``edges`` are the lower bounds of ``labels[1:]``.
+    """
+    text = _text(value).replace(",", "")
+    numbers = [float(n) for n, _ in _NUMBER.findall(text)]
+    if not numbers:
+        return None
+    low = numbers[0]
+    if low >= 1000:
+        low /= 1000
+    if any(marker in text for marker in _BELOW) and len(numbers) == 1:
+        low -= 0.001
+    return labels[sum(1 for edge in edges if low >= edge)]
+
+
+def regions_in(province: str) -> tuple[str, ...]:
+    """The municipal regions known for ``province`` (a two-letter code)."""
+    return tuple(region for region, _ in _REGION_PATTERNS.get(province.upper(), ()))
+
+
+def _region(profile: CompletnessCheckSchema) -> str | None:
+    province = (profile.province or "ON").strip().upper()
+    if province != "ON":
+        return "outside_on"
+    text = _text(profile.city_or_region)
+    if not text:
+        return None
+    for region, pattern in _REGION_PATTERNS[province]:
+        if pattern.search(text):
+            return region
+    return "other_on"
+
+
+def _citizenship(value: str) -> str | None:
+    text = _text(value)
+    if not text:
+        return None
+    if "permanent" in text or text == "pr":
+        return "permanent_resident"
+    if "citizen" in text and "not" not in text:
+        return "citizen"
+    return "other"
+
+
+def _first_time(profile: CompletnessCheckSchema) -> str | None:
+    text = _text(profile.eligibility_first_time_status)
+    if _yes_no(profile.eligibility_spouse_owned) == "yes":
+        return "no"
+    if not text:
+        return None
+    if _FIRST.search(text):
+        return "no" if _NOT_FIRST.search(text) else "yes"
+    if _OWNED.search(text):
+        return "yes" if _NOT_OWNED.search(text) else "no"
+    if text in {"yes", "y", "never"}:
+        return "yes"
+    if text in {"no", "n"}:
+        return "no"
+    return None
+
+
+def _property_type(value: str) -> str | None:
+    text = _text(value)
+    if not text or "not specified" in text:
+        return None
+    if "either" in text or "open" in text or "both" in text:
+        return "either"
+    if "new" in text or "construction" in text or "pre-construction" in text:
+        return "new_construction"
+    if "resale" in text:
+        return "resale"
+    return None
+
+
+def normalize_profile(profile: CompletnessCheckSchema) -> dict[str, str | None]:
+    """Reduce the extracted free-text profile to one normalized value per dimension."""
+    return {
+        "region": _region(profile),
+        "age_18_plus": _yes_no(profile.eligibility_age_18_plus),
+        "citizenship": _citizenship(profile.eligibility_citizenship_status),
+        "first_time": _first_time(profile),
+        "income": _band(profile.income_band, (50, 80, 120, 200), INCOME_BANDS),
+        "down_payment": _band(profile.down_payment_band, (5, 10, 20), DOWN_PAYMENT_BANDS),
+        "credit": _band(profile.credit_band, (600, 660, 725, 760), CREDIT_BANDS),
+        "disability": _yes_no(profile.eligibility_disability_status),
+        "prior_ltt_rebate": _yes_no(profile.eligibility_prior_LTT_rebate),
+        "occupancy": _yes_no(profile.eligibility_occupancy_plan),
+        "property_type": _property_type(profile.eligibility_property_type),
+    }
+
+
+# -- Matching ------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class ProgramMatch:
+    """A program placed in one of the report buckets, with the dimensions that decided it."""
+
+    program: Program
+    dimensions: tuple[str, ...] = ()
+
+
+@dataclass
+class EligibilityReport:
+    matches: list[ProgramMatch] = field(default_factory=list)
+    needs_info: list[ProgramMatch] = field(default_factory=list)
+    no_fit: list[ProgramMatch] = field(default_factory=list)
+
+    def to_prompt(self) -> str:
+        """Render the report as compact markdown for the teaser agent."""
+        lines = ["Precomputed eligibility assessment:", ""]
+        sections = (
+            ("POSSIBLE MATCHES", self.matches, "matched on"),
+            ("NEEDS MORE INFO", self.needs_info, "missing"),
+            ("LIKELY NOT A FIT", self.no_fit, "does not meet"),
+        )
+        for title, entries, verb in sections:
+            lines.append(f"## {title}")
+            if not entries:
+                lines.append("(none)")
+            for entry in entries:
+                program = entry.program
+                lines.append(f"- {program.name}: {program.summary}")
+                lines.append(f"  criteria: {'; '.join(program.criteria)}")
+                if program.needs_review():
+                    lines.append(f"  unverified: confirm the details in {program.source}")
+                if entry.dimensions:
+                    labels = ", ".join(DIMENSION_LABELS[d] for d in entry.dimensions)
+                    lines.append(f"  {verb}: {labels}")
+            lines.append("")
+        return "\n".join(lines).rstrip()
+
+
+class ProgramMatcher:
+    """Evaluates every program's rule rows at once using per-dimension bitsets."""
+
+    def __init__(self, programs: Sequence[Program]) -> None:
+        self._programs = tuple(programs)
+        self._row_program: list[int] = []
+        self._row_constrained: list[tuple[str, ...]] = []
+        self._program_rows: list[int] = []
+        for index, program in enumerate(self._programs):
+            mask = 0
+            for row in program.rows:
+                mask |= 1 << len(self._row_program)
+                self._row_program.append(index)
+                self._row_constrained.append(tuple(row))
+            self._program_rows.append(mask)
+
+        self._all = (1 << len(self._row_program)) - 1
+        # _columns[dim][value]: rows that accept ``value`` (including unconstrained rows).
+        self._columns: dict[str, dict[str, int]] = {}
+        self._unconstrained: dict[str, int] = {}
+        for dim, values in DIMENSIONS.items():
+            free = 0
+            columns = dict.fromkeys(values, 0)
+            bit = 0
+            for program in self._programs:
+                for row in program.rows:
+                    allowed = row.get(dim)
+                    if allowed is None:
+                        free |= 1 << bit
+                    else:
+                        for value in allowed:
+                            columns[value] |= 1 << bit
+                    bit += 1
+            self._unconstrained[dim] = free
+            self._columns[dim] = {value: mask | free for value, mask in columns.items()}
+
+    def evaluate(self, values: Mapping[str, str | None]) -> EligibilityReport:
+        matched = possible = self._all
+        for dim in DIMENSIONS:
+            value = values.get(dim)
+            if value is None:
+                matched &= self._unconstrained[dim]
+                continue
+            column = self._columns[dim].get(value, self._unconstrained[dim])
+            matched &= column
+            possible &= column
+
+        report = EligibilityReport()
+        for index, program in enumerate(self._programs):
+            rows = self._program_rows[index]
+            if rows & matched:
+                dims = self._constrained_dims(rows & matched)
+                report.matches.append(ProgramMatch(program, dims))
+            elif rows & possible:
+                missing = tuple(
+                    dim
+                    for dim in self._constrained_dims(rows & possible)
+                    if values.get(dim) is None
+                )
+                report.needs_info.append(ProgramMatch(program, missing))
+            else:
+                report.no_fit.append(ProgramMatch(program, self._failed_dims(program, values)))
+        return report
+
+    def match(self, profile: CompletnessCheckSchema) -> EligibilityReport:
+        return self.evaluate(normalize_profile(profile))
+
+    def _constrained_dims(self, rows: int) -> tuple[str, ...]:
+        dims: dict[str, None] = {}
+        bit = 0
+        while rows:
+            if rows & 1:
+                dims.update(dict.fromkeys(self._row_constrained[bit]))
+            rows >>= 1
+            bit += 1
+        return tuple(dims)
+
+    @staticmethod
+    def _failed_dims(program: Program, values: Mapping[str, str | None]) -> tuple[str, ...]:
+        failed: dict[str, None] = {}
+        for row in program.rows:
+            for dim, allowed in row.items():
+                value = values.get(dim)
+                if value is not None and value not in allowed:
+                    failed[dim] = None
+        return tuple(failed)
+
+
+program_matcher = ProgramMatcher(PROGRAMS)
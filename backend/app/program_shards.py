@@ -0,0 +1,254 @@
+"""
+Program documents sharded by jurisdiction, with lazily created retrieval backends.
+
+Federal, provincial and municipal program documents live in separate shards keyed
+``ca``, ``on``, ``on/toronto`` and so on. A search only touches the shards that apply
+to the buyer's province and municipality, so its cost follows those shards rather
+than the whole corpus as more provinces are added.
+
+``PROGRAM_SHARDS`` maps shard keys to a vector store id (``vs_...``) or a local
+directory of ``.md``/``.txt`` program documents::
+
+    PROGRAM_SHARDS='{"ca": "vs_123", "on": "vs_456", "on/toronto": "programs/on/toronto"}'
+
+Unset, every search goes to the single ``VECTOR_STORE_ID`` store as before. A shard's
+backend is created on its first search and cached for the life of the process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Mapping, Protocol, Sequence
+
+import orjson
+from openai import AsyncOpenAI
+
+from .dorthy_agent import VECTOR_STORE_ID, CompletnessCheckSchema
+from .metrics import register_metrics
+from .program_rules import normalize_profile, regions_in
+
+logger = logging.getLogger(__name__)
+
+FEDERAL_SHARD = "ca"
+# Used for every search when no shards are configured
+DEFAULT_SHARD = "*"
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+@dataclass(frozen=True)
+class Passage:
+    score: float
+    text: str
+    shard: str = ""
+
+
+class RetrievalBackend(Protocol):
+    async def search(self, query: str, max_results: int) -> list[Passage]: ...
+
+
+def shards_for(profile: CompletnessCheckSchema) -> list[str]:
+    """Federal, provincial and (when known) municipal shard keys for a profile."""
+    province = (profile.province or "ON").strip().lower()
+    shards = [FEDERAL_SHARD, province]
+    region = normalize_profile(profile)["region"]
+    # Municipal shards only for regions of the buyer's own province
+    if region is not None and region in regions_in(province):
+        shards.append(f"{province}/{region}")
+    return shards
+
+
+class VectorStoreBackend:
+    """An OpenAI vector store."""
+
+    def __init__(self, vector_store_id: str, client: AsyncOpenAI) -> None:
+        self._vector_store_id = vector_store_id
+        self._client = client
+
+    async def search(self, query: str, max_results: int) -> list[Passage]:
+        page = await self._client.vector_stores.search(
+            vector_store_id=self._vector_store_id,
+            query=query,
+            max_num_results=max_results,
+        )
+        return [
+            Passage(result.score, "\n".join(chunk.text for chunk in result.content))
+            for result in page.data
+        ]
+
+
+class LocalIndexBackend:
+    """TF-IDF over the paragraphs of a directory of documents, indexed on first search."""
+
+    def __init__(self, directory: Path) -> None:
+        self._directory = directory
+        self._paragraphs: list[str] = []
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        self._idf: dict[str, float] = {}
+        self._loaded: asyncio.Task[None] | None = None
+
+    @property
+    def size(self) -> int:
+        """Paragraphs indexed so far."""
+        return len(self._paragraphs)
+
+    def load(self) -> None:
+        paragraphs: list[str] = []
+        for path in sorted(self._directory.rglob("*")):
+            if path.suffix in (".md", ".txt") and path.is_file():
+                text = path.read_text(encoding="utf-8")
+                paragraphs.extend(p.strip() for p in text.split("\n\n") if p.strip())
+        postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        for index, paragraph in enumerate(paragraphs):
+            for term, count in Counter(_WORD.findall(paragraph.lower())).items():
+                postings[term].append((index, count))
+        self._idf = {
+            term: math.log(1 + len(paragraphs) / len(docs)) for term, docs in postings.items()
+        }
+        self._paragraphs = paragraphs
+        self._postings = dict(postings)
+
+    async def search(self, query: str, max_results: int) -> list[Passage]:
+        if self._loaded is None:
+            self._loaded = asyncio.create_task(asyncio.to_thread(self.load))
+        loaded = self._loaded
+        try:
+            await loaded
+        except Exception:
+            # Let the next search try again rather than caching the failure
+            if self._loaded is loaded:
+                self._loaded = None
+            raise
+        return self.rank(query, max_results)
+
+    def rank(self, query: str, max_results: int) -> list[Passage]:
+        scores: dict[int, float] = defaultdict(float)
+        for term in set(_WORD.findall(query.lower())):
+            idf = self._idf.get(term, 0.0)
+            for index, count in self._postings.get(term, ()):
+                scores[index] += (1 + math.log(count)) * idf
+        best = heapq.nlargest(max_results, scores.items(), key=lambda hit: hit[1])
+        return [Passage(score, self._paragraphs[index]) for index, score in best]
+
+
+class _ShardStats:
+    __slots__ = ("searches", "errors", "total_ms", "max_ms")
+
+    def __init__(self) -> None:
+        self.searches = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+
+class ShardRegistry:
+    """Resolves shard keys to backends, creating each backend on first use."""
+
+    def __init__(self, config: Mapping[str, str], default_store: str | None = None) -> None:
+        self._config = dict(config)
+        if not self._config and default_store:
+            self._config[DEFAULT_SHARD] = default_store
+        self._backends: dict[str, RetrievalBackend] = {}
+        self._stats: dict[str, _ShardStats] = defaultdict(_ShardStats)
+        self._client: AsyncOpenAI | None = None
+
+    @classmethod
+    def from_env(cls) -> ShardRegistry:
+        raw = os.getenv("PROGRAM_SHARDS")
+        config = orjson.loads(raw) if raw else {}
+        return cls({key.lower(): value for key, value in config.items()}, VECTOR_STORE_ID)
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI()
+        return self._client
+
+    def resolve(self, shards: Sequence[str]) -> list[str]:
+        """The configured shards among ``shards`` (all lookups share the default if any)."""
+        if DEFAULT_SHARD in self._config:
+            return [DEFAULT_SHARD]
+        return [shard for shard in shards if shard in self._config]
+
+    def backend(self, shard: str) -> RetrievalBackend:
+        backend = self._backends.get(shard)
+        if backend is None:
+            spec = self._config[shard]
+            if spec.startswith("vs_"):
+                backend = VectorStoreBackend(spec, self.client)
+            else:
+                backend = LocalIndexBackend(Path(spec))
+            self._backends[shard] = backend
+            logger.info(f"Created retrieval backend for shard {shard}")
+        return backend
+
+    async def search(self, shards: Sequence[str], query: str, max_results: int) -> list[Passage]:
+        """Search the configured ``shards`` concurrently and keep the best passages.
+
+        Backends score on different scales (vector similarity vs. TF-IDF), so each
+        shard's scores are divided by its best score before merging. A failing shard
+        is logged and skipped; the search only fails when every shard does.
+        """
+        resolved = self.resolve(shards)
+        results = await asyncio.gather(
+            *(self._search_shard(shard, query, max_results) for shard in resolved),
+            return_exceptions=True,
+        )
+        merged: list[Passage] = []
+        errors: list[BaseException] = []
+        for shard, result in zip(resolved, results):
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result  # cancellation
+            if isinstance(result, BaseException):
+                logger.warning(f"Search of shard {shard} failed: {result}")
+                errors.append(result)
+                continue
+            top = max((passage.score for passage in result), default=0.0)
+            merged.extend(
+                Passage(p.score / top if top > 0 else 0.0, p.text, p.shard) for p in result
+            )
+        if errors and len(errors) == len(resolved):
+            raise errors[0]
+        return heapq.nlargest(max_results, merged, key=lambda passage: passage.score)
+
+    async def _search_shard(self, shard: str, query: str, max_results: int) -> list[Passage]:
+        stats = self._stats[shard]
+        started = time.perf_counter()
+        try:
+            passages = await self.backend(shard).search(query, max_results)
+        except Exception:
+            stats.errors += 1
+            raise
+        elapsed = (time.perf_counter() - started) * 1000
+        stats.searches += 1
+        stats.total_ms += elapsed
+        stats.max_ms = max(stats.max_ms, elapsed)
+        return [Passage(p.score, p.text, shard) for p in passages]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "configured": sorted(self._config),
+            "loaded": sorted(self._backends),
+            "shards": {
+                shard: {
+                    "searches": stats.searches,
+                    "errors": stats.errors,
+                    "avg_ms": round(stats.total_ms / stats.searches, 1) if stats.searches else 0,
+                    "max_ms": round(stats.max_ms, 1),
+                }
+                for shard, stats in self._stats.items()
+            },
+        }
+
+
+program_shards = ShardRegistry.from_env()
+register_metrics("retrieval", program_shards.stats)
@@ -0,0 +1,168 @@
+"""
+Inbound fairness and backpressure for ChatKit streams.
+
+Every streaming request (a new turn, retry or widget action) spends model quota and
+holds a slot on the event loop until the response ends. Before one is processed, the
+limiter checks, in order:
+
+- the client's concurrent streams against ``client_streams`` (429),
+- the client's token bucket, refilled at ``per_minute`` up to ``burst`` (429),
+- streams in flight across all clients against ``global_streams`` (503).
+
+Rejections are immediate and carry ``Retry-After``. Reads are not limited here; they
+are cheap and mostly served by the response cache. Clients are identified by their
+``X-Dorthy-Session`` partition, else by IP: the socket peer's, or, behind proxies, the
+``X-Forwarded-For`` entry ``proxy_hops`` from the end. The header is ignored when
+``proxy_hops`` is 0, since clients can forge it.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Mapping
+
+from .metrics import register_metrics
+
+STREAMING_OPS = frozenset(
+    {
+        "threads.create",
+        "threads.add_user_message",
+        "threads.add_client_tool_output",
+        "threads.retry_after_item",
+        "threads.custom_action",
+    }
+)
+
+# Suggested wait when a stream cap is hit; streams usually finish within seconds.
+_BUSY_RETRY_AFTER = 2
+_PRUNE_INTERVAL = 60.0
+
+
+@dataclass(frozen=True)
+class Rejection:
+    reason: str  # client_streams | client_rate | global_streams
+    status_code: int
+    retry_after: int
+
+
+@dataclass(slots=True)
+class _Client:
+    tokens: float
+    updated: float
+    streams: int = 0
+
+
+class StreamLimiter:
+    """Per-client token buckets and stream caps plus a global in-flight cap."""
+
+    def __init__(
+        self,
+        per_minute: float = 20,
+        burst: int = 10,
+        client_streams: int = 3,
+        global_streams: int = 200,
+        proxy_hops: int = 0,
+    ) -> None:
+        self._rate = per_minute / 60
+        self._burst = burst
+        self._client_streams = client_streams
+        self._global_streams = global_streams
+        self._proxy_hops = proxy_hops
+        self._clients: dict[str, _Client] = {}
+        self._in_flight = 0
+        self._pruned_at = time.monotonic()
+        self.admitted = 0
+        self.rejected: Counter[str] = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self._rate > 0
+
+    def client(
+        self, headers: Mapping[str, str], peer: str | None, session: str | None = None
+    ) -> str:
+        """Client key: the session, else the address the last trusted proxy saw, else the peer."""
+        if session is not None:
+            return f"session:{session}"
+        if self._proxy_hops > 0:
+            hops = [hop.strip() for hop in headers.get("x-forwarded-for", "").split(",")]
+            hops = [hop for hop in hops if hop]
+            if hops:
+                return hops[-min(self._proxy_hops, len(hops))]
+        return peer or "unknown"
+
+    def acquire(self, client: str) -> Rejection | None:
+        """Take a stream slot for ``client``, or say why not; release with ``release``."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        if now - self._pruned_at > _PRUNE_INTERVAL:
+            self._prune(now)
+        state = self._clients.get(client)
+        if state is None:
+            state = self._clients[client] = _Client(tokens=self._burst, updated=now)
+        state.tokens = min(self._burst, state.tokens + (now - state.updated) * self._rate)
+        state.updated = now
+
+        rejection = None
+        if state.streams >= self._client_streams:
+            rejection = Rejection("client_streams", 429, _BUSY_RETRY_AFTER)
+        elif state.tokens < 1:
+            rejection = Rejection("client_rate", 429, math.ceil((1 - state.tokens) / self._rate))
+        elif self._in_flight >= self._global_streams:
+            rejection = Rejection("global_streams", 503, _BUSY_RETRY_AFTER)
+        if rejection is not None:
+            self.rejected[rejection.reason] += 1
+            return rejection
+
+        state.tokens -= 1
+        state.streams += 1
+        self._in_flight += 1
+        self.admitted += 1
+        return None
+
+    def release(self, client: str) -> None:
+        state = self._clients.get(client)
+        if state is not None and state.streams > 0:
+            state.streams -= 1
+            self._in_flight -= 1
+
+    def _prune(self, now: float) -> None:
+        # Idle clients with a full bucket are indistinguishable from new ones.
+        full_after = self._burst / self._rate
+        self._clients = {
+            key: state
+            for key, state in self._clients.items()
+            if state.streams or now - state.updated < full_after
+        }
+        self._pruned_at = now
+
+    def stats(self) -> dict[str, Any]:
+        streams = [state.streams for state in self._clients.values()]
+        return {
+            "enabled": self.enabled,
+            "in_flight": self._in_flight,
+            "global_streams": self._global_streams,
+            "client_streams": self._client_streams,
+            "per_minute": round(self._rate * 60, 2),
+            "burst": self._burst,
+            "clients": len(streams),
+            "clients_streaming": sum(1 for count in streams if count),
+            "max_client_streams": max(streams, default=0),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+stream_limiter = StreamLimiter(
+    per_minute=float(os.getenv("RATE_LIMIT_STREAMS_PER_MINUTE", "20")),
+    burst=int(os.getenv("RATE_LIMIT_BURST", "10")),
+    client_streams=int(os.getenv("RATE_LIMIT_CLIENT_STREAMS", "3")),
+    global_streams=int(os.getenv("RATE_LIMIT_GLOBAL_STREAMS", "200")),
+    proxy_hops=int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0")),
+)
+register_metrics("limiter", stream_limiter.stats)
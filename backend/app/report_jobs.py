@@ -0,0 +1,322 @@
+"""
+Background queue for detailed-report generation.
+
+Report jobs come in when the user agrees to the detailed report (routing picks the
+``report_confirmation`` stage) or through the ``report.request`` widget action, and are
+run by a small pool of in-process async workers, so the chat stream that asked for a
+report closes right away. Jobs are
+recorded in a SQLite table; queued and interrupted jobs are picked up again on
+startup. Failed attempts are retried with exponential backoff up to ``max_attempts``.
+
+Callers learn about completion by polling ``get``/``wait`` (see ``GET /reports``) or
+through ``on_complete``, which the ChatKit server uses to post the report into the
+thread. The table is also the record of a thread's report: routing reads the latest
+job's status from it rather than from thread metadata, which a concurrent turn holding
+an older copy of the thread could overwrite.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+ReportGenerator = Callable[[dict[str, Any]], Awaitable[str]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_jobs (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS report_jobs_thread ON report_jobs (thread_id, created_at);
+CREATE INDEX IF NOT EXISTS report_jobs_status ON report_jobs (status);
+"""
+_COLUMNS = "id, thread_id, status, payload, attempts, result, error, created_at, updated_at"
+
+
+@dataclass(frozen=True)
+class ReportJob:
+    id: str
+    thread_id: str
+    status: str  # queued | running | succeeded | failed
+    payload: dict[str, Any]
+    attempts: int = 0
+    result: str | None = None
+    error: str | None = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def summary(self) -> dict[str, Any]:
+        """Client-facing view; the payload (profile, partition) is never echoed back."""
+        return {
+            "id": self.id,
+            "thread_id": self.thread_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "result": self.result,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobTable:
+    """SQLite-backed job records. Calls block; the queue runs them in a worker thread."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def insert(self, job: ReportJob) -> None:
+        self._execute(
+            f"INSERT INTO report_jobs ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job.id,
+                job.thread_id,
+                job.status,
+                orjson.dumps(job.payload).decode(),
+                job.attempts,
+                job.result,
+                job.error,
+                job.created_at,
+                job.updated_at,
+            ),
+        )
+
+    def update(self, job: ReportJob) -> None:
+        self._execute(
+            "UPDATE report_jobs SET status = ?, attempts = ?, result = ?, error = ?, "
+            "updated_at = ? WHERE id = ?",
+            (job.status, job.attempts, job.result, job.error, job.updated_at, job.id),
+        )
+
+    def get(self, job_id: str) -> ReportJob | None:
+        rows = self._select("WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def active_for_thread(self, thread_id: str) -> ReportJob | None:
+        rows = self._select(
+            "WHERE thread_id = ? AND status IN ('queued', 'running') "
+            "ORDER BY created_at DESC LIMIT 1",
+            (thread_id,),
+        )
+        return rows[0] if rows else None
+
+    def latest_for_thread(self, thread_id: str) -> ReportJob | None:
+        rows = self._select(
+            "WHERE thread_id = ? ORDER BY created_at DESC LIMIT 1",
+            (thread_id,),
+        )
+        return rows[0] if rows else None
+
+    def unfinished(self) -> list[ReportJob]:
+        return self._select("WHERE status IN ('queued', 'running') ORDER BY created_at", ())
+
+    def _execute(self, sql: str, params: tuple[Any, ...]) -> None:
+        assert self._conn is not None, "JobTable.open() was not called"
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+
+    def _select(self, where: str, params: tuple[Any, ...]) -> list[ReportJob]:
+        assert self._conn is not None, "JobTable.open() was not called"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM report_jobs {where}", params
+            ).fetchall()
+        return [ReportJob(row[0], row[1], row[2], orjson.loads(row[3]), *row[4:]) for row in rows]
+
+
+class ReportQueue:
+    """In-process worker pool over a ``JobTable``; ``workers`` caps concurrent generations."""
+
+    def __init__(
+        self,
+        table: JobTable,
+        generate: ReportGenerator,
+        *,
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_delay: float = 5.0,
+        on_complete: Callable[[ReportJob], Awaitable[None]] | None = None,
+    ) -> None:
+        self._table = table
+        self._generate = generate
+        self._workers = workers
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._on_complete = on_complete
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._tasks: list[asyncio.Task[None]] = []
+        self._finished: dict[str, asyncio.Event] = {}
+        self._waiters: Counter[str] = Counter()
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.running = 0
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self._table.open)
+        # Jobs interrupted by a restart run again from the start.
+        for job in await asyncio.to_thread(self._table.unfinished):
+            await self._save(replace(job, status="queued"))
+            self._queue.put_nowait(job.id)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"report-worker-{n}")
+            for n in range(self._workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self._table.close)
+
+    async def submit(self, thread_id: str, payload: dict[str, Any]) -> ReportJob:
+        """Queue a report for ``thread_id``, or return the one already in progress."""
+        active = await asyncio.to_thread(self._table.active_for_thread, thread_id)
+        if active is not None:
+            return active
+        now = time.time()
+        job = ReportJob(
+            id=f"rpt_{secrets.token_hex(8)}",
+            thread_id=thread_id,
+            status="queued",
+            payload=payload,
+            created_at=now,
+            updated_at=now,
+        )
+        await asyncio.to_thread(self._table.insert, job)
+        self.submitted += 1
+        self._queue.put_nowait(job.id)
+        logger.info(f"Queued report {job.id} for thread {thread_id}")
+        return job
+
+    async def get(self, job_id: str) -> ReportJob | None:
+        return await asyncio.to_thread(self._table.get, job_id)
+
+    async def latest(self, thread_id: str) -> ReportJob | None:
+        """The thread's most recent report job, if it ever asked for one."""
+        return await asyncio.to_thread(self._table.latest_for_thread, thread_id)
+
+    async def wait(self, job_id: str, timeout: float) -> ReportJob | None:
+        """Long-poll: return the job once it is done or ``timeout`` seconds have passed."""
+        if timeout <= 0:
+            return await self.get(job_id)
+        # Registered before the lookup, so a job finishing in between still wakes us
+        event = self._finished.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] += 1
+        try:
+            job = await self.get(job_id)
+            if job is None or job.done:
+                return job
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return await self.get(job_id)
+        finally:
+            self._waiters[job_id] -= 1
+            if not self._waiters[job_id]:
+                del self._waiters[job_id]
+                # Jobs that are polled but never finish would otherwise leave events behind
+                if self._finished.get(job_id) is event:
+                    del self._finished[job_id]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "workers": self._workers,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = await self.get(job_id)
+                if job is not None and job.status == "queued":
+                    await self._run(job)
+            except Exception as e:
+                logger.error(f"Report worker failed on {job_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: ReportJob) -> None:
+        job = replace(job, status="running", attempts=job.attempts + 1)
+        await self._save(job)
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            result = await self._generate(job.payload)
+        except Exception as e:
+            if job.attempts < self._max_attempts:
+                delay = self._retry_delay * 2 ** (job.attempts - 1)
+                logger.warning(
+                    f"Report {job.id} attempt {job.attempts} failed: {e}; retrying in {delay:.0f}s"
+                )
+                self.retries += 1
+                await self._save(replace(job, status="queued", error=str(e)))
+                asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job.id)
+                return
+            logger.error(f"Report {job.id} failed after {job.attempts} attempts: {e}")
+            self.failed += 1
+            await self._finish(replace(job, status="failed", error=str(e)))
+            return
+        finally:
+            self.running -= 1
+
+        logger.info(f"Report {job.id} generated in {time.perf_counter() - started:.1f}s")
+        self.succeeded += 1
+        await self._finish(replace(job, status="succeeded", result=result, error=None))
+
+    async def _finish(self, job: ReportJob) -> None:
+        await self._save(job)
+        event = self._finished.pop(job.id, None)
+        if event is not None:
+            event.set()
+        if self._on_complete is not None:
+            try:
+                await self._on_complete(job)
+            except Exception as e:
+                logger.warning(f"Completion handler failed for report {job.id}: {e}")
+
+    async def _save(self, job: ReportJob) -> None:
+        await asyncio.to_thread(self._table.update, replace(job, updated_at=time.time()))
@@ -0,0 +1,262 @@
+"""
+On-demand sampling profiler for the chat path.
+
+A request is profiled when it carries ``X-Dorthy-Profile: <PROFILE_ADMIN_TOKEN>`` or is
+picked by ``PROFILE_SAMPLE_RATE``. While any profiled request is in flight a daemon
+thread samples the event loop's stack every few milliseconds and attributes each
+sample to the request whose frames are on it. When a request is suspended, its
+awaited coroutine chain is recorded instead, so the result is a wall-clock profile
+that also shows time spent waiting on the routing call or the agent stream.
+
+Each request is written to ``PROFILE_DIR`` as a folded-stack file
+(``frame;frame;frame count`` per line) that flamegraph.pl, speedscope and inferno
+read directly. Requests that are not profiled pay for one header lookup.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from types import FrameType
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Mapping, TypeVar
+
+from .metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-dorthy-profile"
+CONTEXT_KEY = "request_profile"
+
+_NAME = re.compile(r"^[\w.-]+$")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _frame_of(target: Any) -> FrameType | None:
+    if isinstance(target, FrameType):
+        return target
+    return getattr(target, "cr_frame", None) or getattr(target, "ag_frame", None)
+
+
+def _awaiting(target: Any) -> list[str]:
+    """Labels of the coroutine chain ``target`` is suspended in, outermost first."""
+    labels: list[str] = []
+    while target is not None:
+        if isinstance(target, asyncio.Task):
+            target = target.get_coro()
+            continue
+        frame = _frame_of(target)
+        if frame is None:
+            kind = type(target).__name__
+            labels.append(f"[await {'Future' if kind == 'FutureIter' else kind}]")
+            break
+        labels.append(_label(frame))
+        if hasattr(target, "ag_await") and target.ag_await is None:
+            labels.append("[yield]")
+            break
+        target = getattr(target, "cr_await", None) or getattr(target, "ag_await", None)
+    return labels
+
+
+class RequestProfile:
+    """Samples collected for one request."""
+
+    def __init__(self, name: str, thread_ident: int) -> None:
+        self.name = name
+        self.thread_ident = thread_ident
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.labels: dict[str, Any] = {}
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        # Frames are matched against the running stack; coroutines and async generators
+        # are also walked while they are suspended.
+        self._roots: list[Any] = []
+
+    def watch(self, target: FrameType | Any) -> None:
+        self._roots.append(target)
+
+    def sample(self, running: FrameType | None) -> None:
+        chain: list[FrameType] = []
+        while running is not None:
+            chain.append(running)
+            running = running.f_back
+        positions = {id(frame): depth for depth, frame in enumerate(chain)}
+
+        # Latest roots first: the innermost watched code gets the sample.
+        for root in reversed(self._roots):
+            frame = _frame_of(root)
+            depth = positions.get(id(frame)) if frame is not None else None
+            if depth is not None and chain[depth] is frame:
+                self._add([_label(f) for f in reversed(chain[: depth + 1])])
+                return
+        for root in reversed(self._roots):
+            if not isinstance(root, FrameType) and _frame_of(root) is not None:
+                self._add(_awaiting(root))
+                return
+
+    def _add(self, labels: list[str]) -> None:
+        self.stacks[";".join(labels)] += 1
+        self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 1),
+            "samples": self.samples,
+            **self.labels,
+        }
+
+
+class RequestProfiler:
+    """Decides which requests to profile, runs the sampler and keeps the recent index."""
+
+    def __init__(
+        self,
+        directory: Path,
+        admin_token: str | None = None,
+        sample_rate: float = 0.0,
+        interval: float = 0.005,
+        keep: int = 100,
+    ) -> None:
+        self.directory = directory
+        self._admin_token = admin_token
+        self._sample_rate = sample_rate
+        self._interval = interval
+        self._recent: deque[dict[str, Any]] = deque()
+        self._keep = keep
+        self._active: list[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._sampler: threading.Thread | None = None
+        self.written = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._admin_token) or self._sample_rate > 0
+
+    def authorized(self, headers: Mapping[str, str]) -> bool:
+        supplied = headers.get(PROFILE_HEADER)
+        return bool(self._admin_token and supplied) and secrets.compare_digest(
+            supplied or "", self._admin_token or ""
+        )
+
+    def start(self, headers: Mapping[str, str]) -> RequestProfile | None:
+        """Begin profiling the current request if it asked for it or was sampled."""
+        if not self.enabled:
+            return None
+        if not self.authorized(headers) and (
+            self._sample_rate <= 0 or random.random() >= self._sample_rate
+        ):
+            return None
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{secrets.token_hex(3)}"
+        profile = RequestProfile(name, threading.get_ident())
+        with self._lock:
+            self._active.append(profile)
+            if self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self._run, name="request-profiler", daemon=True
+                )
+                self._sampler.start()
+        return profile
+
+    def finish(self, profile: RequestProfile) -> None:
+        with self._lock:
+            if profile not in self._active:
+                return
+            self._active.remove(profile)
+        profile.duration = time.time() - profile.started_at
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / f"{profile.name}.folded").write_text(profile.folded())
+        except OSError as e:
+            logger.warning(f"Could not write profile {profile.name}: {e}")
+            return
+        self.written += 1
+        self._recent.appendleft(profile.summary())
+        while len(self._recent) > self._keep:
+            evicted = self._recent.pop()
+            (self.directory / f"{evicted['name']}.folded").unlink(missing_ok=True)
+        logger.info(
+            f"Profile {profile.name}: {profile.samples} samples over "
+            f"{profile.duration * 1000:.0f} ms"
+        )
+
+    async def stream(
+        self, profile: RequestProfile, source: AsyncIterable[bytes]
+    ) -> AsyncIterator[bytes]:
+        """Forward a response stream, profiling it and finishing the profile at the end."""
+        profile.watch(sys._getframe())
+        try:
+            async for chunk in source:
+                yield chunk
+        finally:
+            self.finish(profile)
+
+    def recent(self) -> list[dict[str, Any]]:
+        return list(self._recent)
+
+    def path(self, name: str) -> Path | None:
+        if not _NAME.match(name) or not any(p["name"] == name for p in self._recent):
+            return None
+        return self.directory / f"{name}.folded"
+
+    def stats(self) -> dict[str, Any]:
+        return {"enabled": self.enabled, "active": len(self._active), "written": self.written}
+
+    def _run(self) -> None:
+        while True:
+            # Sampling under the lock means a finished profile is never written mid-sample.
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                frames = sys._current_frames()
+                for profile in self._active:
+                    profile.sample(frames.get(profile.thread_ident))
+                del frames
+            time.sleep(self._interval)
+
+
+def profiled(respond: F) -> F:
+    """Let the request's profile follow ``respond`` while it is suspended."""
+
+    @functools.wraps(respond)
+    def wrapper(self: Any, thread: Any, item: Any, context: dict[str, Any]) -> Any:
+        stream = respond(self, thread, item, context)
+        profile = context.get(CONTEXT_KEY)
+        if profile is not None:
+            profile.labels["thread_id"] = thread.id
+            profile.watch(stream)
+        return stream
+
+    return wrapper  # type: ignore[return-value]
+
+
+request_profiler = RequestProfiler(
+    Path(os.getenv("PROFILE_DIR") or Path(tempfile.gettempdir()) / "dorthy-profiles"),
+    admin_token=os.getenv("PROFILE_ADMIN_TOKEN") or None,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    keep=int(os.getenv("PROFILE_KEEP", "100")),
+)
+register_metrics("profiler", request_profiler.stats)
@@ -0,0 +1,100 @@
+"""
+Conditional-GET style caching for non-streaming ChatKit reads.
+
+Thread, thread-list and item-page reads are keyed by the store partition, the raw
+request payload and the store version they depend on. A client presenting the current ETag gets a 304; any
+other repeat of the same read is served from a small LRU of serialized bodies, so
+neither case touches the store or rebuilds pydantic models.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import secrets
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import orjson
+
+from .memory_store import MemoryStore
+from .metrics import register_metrics
+
+CACHEABLE_OPS = frozenset({"threads.get_by_id", "threads.list", "items.list"})
+
+
+@dataclass(frozen=True)
+class CacheLookup:
+    key: str
+    etag: str
+    version: int
+    body: bytes | None
+    request: dict[str, Any]
+    partition: str
+
+
+class ResponseCache:
+    """LRU of serialized read responses validated against store versions."""
+
+    def __init__(self, max_entries: int = 512) -> None:
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[int, bytes]] = OrderedDict()
+        # Random per process so ETags never collide across restarts.
+        self._epoch = secrets.token_hex(4)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def lookup(self, payload: bytes, store: MemoryStore, partition: str) -> CacheLookup | None:
+        """Return the ETag and any cached body for a cacheable read, else None."""
+        try:
+            request = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            return None
+        if not isinstance(request, dict) or request.get("type") not in CACHEABLE_OPS:
+            return None
+
+        version = self._version(request, store, partition)
+        if version is None:
+            return None
+        digest = hashlib.blake2b(partition.encode(), digest_size=12)
+        digest.update(b"\0" + payload)
+        key = digest.hexdigest()
+        etag = f'"{self._epoch}-{key}-{version}"'
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            return CacheLookup(key, etag, version, entry[1], request, partition)
+        return CacheLookup(key, etag, version, None, request, partition)
+
+    def put(self, lookup: CacheLookup, body: bytes, store: MemoryStore) -> None:
+        """Cache ``body`` unless the store changed while it was being produced."""
+        if self._version(lookup.request, store, lookup.partition) != lookup.version:
+            return
+        self._entries[lookup.key] = (lookup.version, body)
+        self._entries.move_to_end(lookup.key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+    @staticmethod
+    def _version(request: dict[str, Any], store: MemoryStore, partition: str) -> int | None:
+        if request["type"] == "threads.list":
+            return store.list_version(partition)
+        thread_id = (request.get("params") or {}).get("thread_id")
+        if not isinstance(thread_id, str):
+            return None
+        return store.thread_version(thread_id, partition)
+
+
+response_cache = ResponseCache(max_entries=int(os.getenv("RESPONSE_CACHE_ENTRIES", "512")))
+register_metrics("response_cache", response_cache.stats)
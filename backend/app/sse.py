@@ -0,0 +1,218 @@
+"""
+SSE writer stage between ChatKit's event stream and the HTTP response.
+
+ChatKit yields one ``data: ...`` frame per event, which for token deltas means a
+write per token. The writer coalesces adjacent text deltas for the same content
+part, batches frames by time and size, keeps idle connections alive with comment
+heartbeats (e.g. while routing runs) and can gzip the stream.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, AsyncIterator
+
+import orjson
+
+from .metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+_DATA_PREFIX = b"data: "
+_TEXT_DELTA = "assistant_message.content_part.text_delta"
+_HEARTBEAT = b": keep-alive\n\n"
+
+
+@dataclass(frozen=True)
+class SSEConfig:
+    flush_interval: float = 0.05
+    flush_bytes: int = 16 * 1024
+    heartbeat_interval: float = 10.0
+    compress: bool = False
+
+    @classmethod
+    def from_env(cls) -> SSEConfig:
+        return cls(
+            flush_interval=float(os.getenv("SSE_FLUSH_INTERVAL_SECONDS", "0.05")),
+            flush_bytes=int(os.getenv("SSE_FLUSH_BYTES", str(16 * 1024))),
+            heartbeat_interval=float(os.getenv("SSE_HEARTBEAT_SECONDS", "10")),
+            compress=os.getenv("SSE_COMPRESS", "false").lower() == "true",
+        )
+
+
+class _Totals:
+    def __init__(self) -> None:
+        self.streams = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.writes = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.heartbeats = 0
+
+    def stats(self) -> dict[str, Any]:
+        return dict(vars(self))
+
+
+_totals = _Totals()
+register_metrics("sse", _totals.stats)
+
+
+class SSEWriter:
+    """Async iterable of coalesced, optionally gzipped SSE bytes for one stream."""
+
+    def __init__(self, source: AsyncIterable[bytes], config: SSEConfig, gzip: bool = False):
+        self._source = source
+        self._config = config
+        self._compressor = zlib.compressobj(wbits=31) if gzip else None
+
+        self._buffer: list[bytes] = []
+        self._buffered_bytes = 0
+        # (item_id, content_index, delta parts, template event) of the open delta run
+        self._delta: tuple[str, int, list[str], dict[str, Any]] | None = None
+
+        self.frames_in = 0
+        self.frames_out = 0
+        self.writes = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.heartbeats = 0
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        if self._compressor is not None:
+            headers["Content-Encoding"] = "gzip"
+        return headers
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        # The source runs in a single pump task so its context variables stay consistent;
+        # the bounded queue applies backpressure to it when the client is slow.
+        queue: asyncio.Queue[bytes | BaseException | None] = asyncio.Queue(maxsize=256)
+        pump = asyncio.ensure_future(self._pump(queue))
+        last_write = 0.0
+        try:
+            while True:
+                if self._has_pending():
+                    timeout = max(0.0, last_write + self._config.flush_interval - time.monotonic())
+                else:
+                    timeout = self._config.heartbeat_interval
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    if self._has_pending():
+                        yield self._write(self._drain())
+                    else:
+                        self.heartbeats += 1
+                        yield self._write(_HEARTBEAT)
+                    last_write = time.monotonic()
+                    continue
+
+                if frame is None:
+                    break
+                if isinstance(frame, BaseException):
+                    raise frame
+                self._accept(frame)
+
+                due = time.monotonic() >= last_write + self._config.flush_interval
+                if due or self._buffered_bytes >= self._config.flush_bytes:
+                    yield self._write(self._drain())
+                    last_write = time.monotonic()
+
+            if self._has_pending():
+                yield self._write(self._drain())
+            if self._compressor is not None:
+                tail = self._compressor.flush(zlib.Z_FINISH)
+                self.bytes_out += len(tail)
+                yield tail
+        finally:
+            pump.cancel()
+            self._record()
+
+    async def _pump(self, queue: asyncio.Queue[bytes | BaseException | None]) -> None:
+        try:
+            async for frame in self._source:
+                await queue.put(frame)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    def _accept(self, frame: bytes) -> None:
+        self.frames_in += 1
+        self.bytes_in += len(frame)
+
+        event = self._parse_delta(frame)
+        if event is not None:
+            key = (event["item_id"], event["update"]["content_index"])
+            if self._delta is not None and self._delta[:2] == key:
+                self._delta[2].append(event["update"]["delta"])
+                self._buffered_bytes += len(event["update"]["delta"])
+                return
+            self._close_delta()
+            self._delta = (key[0], key[1], [event["update"]["delta"]], event)
+            self._buffered_bytes += len(frame)
+            return
+
+        self._close_delta()
+        self._buffer.append(frame)
+        self._buffered_bytes += len(frame)
+
+    @staticmethod
+    def _parse_delta(frame: bytes) -> dict[str, Any] | None:
+        # Cheap substring check first so only text deltas pay for JSON parsing.
+        if _TEXT_DELTA.encode() not in frame or not frame.startswith(_DATA_PREFIX):
+            return None
+        try:
+            event = orjson.loads(frame[len(_DATA_PREFIX) :])
+        except orjson.JSONDecodeError:
+            return None
+        update = event.get("update") or {}
+        if event.get("type") != "thread.item.updated" or update.get("type") != _TEXT_DELTA:
+            return None
+        return event
+
+    def _close_delta(self) -> None:
+        if self._delta is None:
+            return
+        _, _, parts, event = self._delta
+        event["update"]["delta"] = "".join(parts)
+        self._buffer.append(_DATA_PREFIX + orjson.dumps(event) + b"\n\n")
+        self._delta = None
+
+    def _has_pending(self) -> bool:
+        return bool(self._buffer) or self._delta is not None
+
+    def _drain(self) -> bytes:
+        self._close_delta()
+        self.frames_out += len(self._buffer)
+        data = b"".join(self._buffer)
+        self._buffer.clear()
+        self._buffered_bytes = 0
+        return data
+
+    def _write(self, data: bytes) -> bytes:
+        if self._compressor is not None:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.writes += 1
+        self.bytes_out += len(data)
+        return data
+
+    def _record(self) -> None:
+        _totals.streams += 1
+        _totals.frames_in += self.frames_in
+        _totals.frames_out += self.frames_out
+        _totals.writes += self.writes
+        _totals.bytes_in += self.bytes_in
+        _totals.bytes_out += self.bytes_out
+        _totals.heartbeats += self.heartbeats
+        logger.info(
+            f"SSE stream: {self.frames_in} frames in, {self.frames_out} frames out in "
+            f"{self.writes} writes, {self.bytes_in} -> {self.bytes_out} bytes, "
+            f"{self.heartbeats} heartbeats"
+        )
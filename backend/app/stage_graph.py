@@ -0,0 +1,282 @@
+"""
+Declarative stage graph used to route a conversation turn between agents.
+
+Stages are nodes that wrap a single agent run. Routing stages run to completion and
+publish their typed ``final_output``; routes are predicates over those outputs that
+pick the terminal stage, which is always streamed back to the client.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Mapping, Protocol, Sequence
+
+from agents import Agent, RunConfig, Runner
+from agents.items import TResponseInputItem
+from agents.result import RunResultStreaming
+
+from .input_projection import Projection, projection_stats
+from .latency_budget import BudgetExceeded, LatencyBudget
+from .tracing import record_usage, set_attributes, span, start_span, use_span
+
+logger = logging.getLogger(__name__)
+
+StageOutputs = Mapping[str, Any]
+InputPreparer = Callable[[StageOutputs, list[TResponseInputItem]], list[TResponseInputItem]]
+Fallback = Callable[[StageOutputs], Any]
+OutputMapper = Callable[[StageOutputs, Any], Any]
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A node in the graph.
+
+    ``terminal`` stages are streamed to the client; every other stage is a routing
+    stage whose output feeds the route predicates. ``requires`` lists routing stages
+    that must finish first; stages without unmet requirements run concurrently.
+    ``project`` trims the shared history to the view this stage's agent needs,
+    ``prepare`` may then rewrite that input from the outputs so far (including the
+    seed), and ``output`` maps a routing stage's raw ``final_output`` to what it
+    publishes, e.g. to expand a compact model answer.
+
+    A routing stage with a ``budget`` is hedged past its learned p95. If the hard
+    budget runs out and ``fallback`` returns a substitute output, routing continues
+    with it and the real output is exposed on ``GraphRun.late`` for reconciliation.
+    """
+
+    name: str
+    agent: Agent[Any]
+    terminal: bool = False
+    requires: tuple[str, ...] = ()
+    prepare: InputPreparer | None = None
+    budget: LatencyBudget | None = None
+    fallback: Fallback | None = None
+    output: OutputMapper | None = None
+    project: Projection | None = None
+
+
+@dataclass(frozen=True)
+class Route:
+    """Pick ``target`` when ``when`` holds for the routing outputs."""
+
+    target: str
+    when: Callable[[StageOutputs], bool]
+
+
+class StageHooks(Protocol):
+    """Timing callbacks fired around every stage."""
+
+    def on_stage_start(self, stage: str) -> None: ...
+
+    def on_stage_end(self, stage: str, elapsed: float) -> None: ...
+
+
+class LoggingStageHooks:
+    """Default hooks: log how long every stage took."""
+
+    def on_stage_start(self, stage: str) -> None:
+        logger.info(f"Stage {stage} started")
+
+    def on_stage_end(self, stage: str, elapsed: float) -> None:
+        logger.info(f"Stage {stage} finished in {elapsed * 1000:.0f} ms")
+
+
+@dataclass
+class GraphRun:
+    """Outcome of routing a turn: the chosen terminal stage and its live stream."""
+
+    stage: str
+    outputs: dict[str, Any]
+    result: RunResultStreaming
+    timings: dict[str, float] = field(default_factory=dict)
+    late: dict[str, asyncio.Future[Any]] = field(default_factory=dict)
+    _hooks: StageHooks | None = None
+    _started_at: float = 0.0
+    _span: Any = None
+
+    def complete(self) -> None:
+        """Record the terminal stage timing and end its span.
+
+        Call it in a ``finally`` once the stream is drained or abandoned; it is the only
+        place the stage span ends. Later calls do nothing.
+        """
+        if self.stage in self.timings:
+            return
+        elapsed = time.perf_counter() - self._started_at
+        self.timings[self.stage] = elapsed
+        if self._span is not None:
+            try:
+                record_usage(self._span, self.result.context_wrapper.usage)
+            finally:
+                self._span.end()
+        if self._hooks is not None:
+            self._hooks.on_stage_end(self.stage, elapsed)
+
+
+class StageGraph:
+    """Runs routing stages in dependency waves, then streams the selected terminal."""
+
+    def __init__(
+        self,
+        stages: Sequence[Stage],
+        routes: Sequence[Route],
+        default: str,
+        *,
+        workflow: str,
+    ) -> None:
+        self._stages = {stage.name: stage for stage in stages}
+        self._routes = tuple(routes)
+        self._default = default
+        self._workflow = workflow
+
+        terminals = {stage.name for stage in stages if stage.terminal}
+        for target in [route.target for route in self._routes] + [default]:
+            if target not in terminals:
+                raise ValueError(f"Route target {target!r} is not a terminal stage")
+        for stage in stages:
+            for required in stage.requires:
+                if required not in self._stages or required in terminals:
+                    raise ValueError(f"Stage {stage.name!r} requires unknown stage {required!r}")
+
+    @property
+    def routing_stages(self) -> list[Stage]:
+        return [stage for stage in self._stages.values() if not stage.terminal]
+
+    def select(self, outputs: StageOutputs) -> str:
+        """Return the terminal stage the routes pick for ``outputs``."""
+        return next(
+            (route.target for route in self._routes if route.when(outputs)),
+            self._default,
+        )
+
+    def run_config(self, stage: str) -> RunConfig:
+        return RunConfig(
+            trace_metadata={
+                "__trace_source__": "chatkit",
+                "workflow": self._workflow,
+                "step": stage,
+            }
+        )
+
+    async def run(
+        self,
+        input_items: Sequence[TResponseInputItem],
+        hooks: StageHooks | None = None,
+        seed: Mapping[str, Any] | None = None,
+    ) -> GraphRun:
+        """Route ``input_items`` and start streaming the selected terminal stage.
+
+        The caller's list is never mutated; every stage receives its own copy.
+        ``seed`` values (e.g. the thread) are visible to routes and preparers
+        alongside the routing outputs.
+        """
+        hooks = hooks or LoggingStageHooks()
+        outputs: dict[str, Any] = dict(seed or {})
+        timings: dict[str, float] = {}
+        late: dict[str, asyncio.Future[Any]] = {}
+
+        pending = self.routing_stages
+        while pending:
+            ready = [s for s in pending if all(r in outputs for r in s.requires)]
+            if not ready:
+                raise ValueError("Stage graph has a dependency cycle")
+            results = await asyncio.gather(
+                *(
+                    self._run_routing_stage(stage, input_items, hooks, timings, outputs, late)
+                    for stage in ready
+                )
+            )
+            for stage, output in zip(ready, results):
+                outputs[stage.name] = output
+            pending = [stage for stage in pending if stage.name not in outputs]
+
+        terminal = self._stages[self.select(outputs)]
+        terminal_input = self._project(terminal, input_items)
+        if terminal.prepare is not None:
+            terminal_input = terminal.prepare(outputs, terminal_input)
+        hooks.on_stage_start(terminal.name)
+        # Ended by GraphRun.complete(), which the caller runs in a finally
+        run_span = start_span(
+            "agent.run", stage=terminal.name, agent=terminal.agent.name, streamed=True
+        )
+        try:
+            with use_span(run_span):
+                result = Runner.run_streamed(
+                    terminal.agent,
+                    terminal_input,
+                    run_config=self.run_config(terminal.name),
+                )
+        except BaseException:
+            run_span.end()
+            raise
+        return GraphRun(
+            stage=terminal.name,
+            outputs=outputs,
+            result=result,
+            timings=timings,
+            late=late,
+            _hooks=hooks,
+            _started_at=time.perf_counter(),
+            _span=run_span,
+        )
+
+    @staticmethod
+    def _project(
+        stage: Stage, input_items: Sequence[TResponseInputItem]
+    ) -> list[TResponseInputItem]:
+        if stage.project is None:
+            return list(input_items)
+        projected = stage.project(input_items)
+        projection_stats.record(stage.name, input_items, projected)
+        return projected
+
+    async def _run_routing_stage(
+        self,
+        stage: Stage,
+        input_items: Sequence[TResponseInputItem],
+        hooks: StageHooks,
+        timings: dict[str, float],
+        outputs: StageOutputs,
+        late: dict[str, asyncio.Future[Any]],
+    ) -> Any:
+        hooks.on_stage_start(stage.name)
+        started = time.perf_counter()
+        stage_input = self._project(stage, input_items)
+        if stage.prepare is not None:
+            stage_input = stage.prepare(outputs, stage_input)
+
+        async def call() -> Any:
+            # One span per attempt, so hedged calls show up side by side
+            with span("agent.run", stage=stage.name, agent=stage.agent.name) as run_span:
+                result = await Runner.run(
+                    stage.agent,
+                    input=list(stage_input),
+                    run_config=self.run_config(stage.name),
+                )
+                record_usage(run_span, result.context_wrapper.usage)
+            if stage.output is not None:
+                return stage.output(outputs, result.final_output)
+            return result.final_output
+
+        try:
+            with span("stage.route", stage=stage.name) as stage_span:
+                if stage.budget is None:
+                    return await call()
+                try:
+                    return await stage.budget.run(call)
+                except BudgetExceeded as exc:
+                    substitute = stage.fallback(outputs) if stage.fallback else None
+                    if substitute is None:
+                        logger.warning(f"Stage {stage.name} over budget with no fallback; waiting")
+                        return await exc.pending
+                    stage.budget.fallbacks += 1
+                    logger.warning(f"Stage {stage.name} over budget; using fallback output")
+                    set_attributes(stage_span, fallback=True)
+                    late[stage.name] = exc.pending
+                    return substitute
+        finally:
+            timings[stage.name] = time.perf_counter() - started
+            hooks.on_stage_end(stage.name, timings[stage.name])
@@ -0,0 +1,179 @@
+"""
+Binary snapshots of the in-memory store for warm restarts.
+
+Layout::
+
+    MAGIC (8 bytes) | index offset (u64) | index length (u64)
+    item blobs (zlib-compressed JSON arrays), one per thread
+    index (JSON array of [thread_id, created_key, version, metadata, offset, length,
+           partition])
+
+The file is memory-mapped on startup. Only the index is parsed eagerly; thread
+metadata and items are decoded the first time a thread is touched. Index rows written
+before threads were partitioned have no partition and restore into the default one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable
+
+import orjson
+from chatkit.types import ThreadItem, ThreadMetadata
+
+from .cold_thread import DEFAULT_PARTITION, ColdThread, encode_items, encode_metadata
+
+if TYPE_CHECKING:
+    from .memory_store import MemoryStore
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DORTHY01"
+_HEADER = struct.Struct("<8sQQ")
+
+
+@dataclass(frozen=True)
+class SnapshotRecord:
+    """A hot thread as captured for writing."""
+
+    thread_id: str
+    created_key: float
+    version: int
+    thread: ThreadMetadata
+    items: list[ThreadItem]
+    partition: str
+
+
+def created_key(created_at: Any) -> float:
+    """Sort key shared by live threads and snapshot entries."""
+    return created_at.timestamp() if created_at else float("-inf")
+
+
+def write_snapshot(path: Path, records: Iterable[SnapshotRecord | ColdThread]) -> int:
+    """Write ``records`` to ``path`` atomically; returns the number of threads written.
+
+    Runs in a worker thread, so it only reads the captured records. Cold threads are
+    written by copying their blobs without decoding them.
+    """
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    index: list[list[Any]] = []
+    with open(tmp, "wb") as fh:
+        fh.write(_HEADER.pack(MAGIC, 0, 0))
+        offset = _HEADER.size
+        for record in records:
+            if isinstance(record, ColdThread):
+                blob: bytes | memoryview = record.blob
+                metadata = record.metadata_json
+            else:
+                blob = encode_items(record.items, level=1)
+                metadata = encode_metadata(record.thread)
+            fh.write(blob)
+            index.append(
+                [
+                    record.thread_id,
+                    record.created_key,
+                    record.version,
+                    orjson.Fragment(metadata),
+                    offset,
+                    len(blob),
+                    record.partition,
+                ]
+            )
+            offset += len(blob)
+        encoded = orjson.dumps(index)
+        fh.write(encoded)
+        fh.seek(0)
+        fh.write(_HEADER.pack(MAGIC, offset, len(encoded)))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    return len(index)
+
+
+def read_snapshot(path: Path) -> list[ColdThread]:
+    """Map ``path`` and return lazily decoded cold threads (empty if there is no snapshot)."""
+    if not path.exists() or path.stat().st_size < _HEADER.size:
+        return []
+    with open(path, "rb") as fh:
+        # The mapping outlives the file handle; entries keep it alive via their views.
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, index_offset, index_length = _HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        logger.warning(f"Ignoring snapshot {path}: unknown format")
+        return []
+    view = memoryview(mapped)
+    index = orjson.loads(view[index_offset : index_offset + index_length])
+    return [
+        ColdThread(
+            thread_id,
+            key,
+            version,
+            metadata,
+            view[offset : offset + length],
+            partition[0] if partition else DEFAULT_PARTITION,
+        )
+        for thread_id, key, version, metadata, offset, length, *partition in index
+    ]
+
+
+class SnapshotManager:
+    """Restores the store at startup and snapshots it periodically and on shutdown."""
+
+    def __init__(self, store: MemoryStore, path: Path, interval: float) -> None:
+        self._store = store
+        self._path = path
+        self._interval = interval
+        self._task: asyncio.Task[None] | None = None
+        self._lock = asyncio.Lock()
+        self._written_clock = -1
+
+    def restore(self) -> int:
+        started = time.perf_counter()
+        entries = read_snapshot(self._path)
+        self._store.attach_snapshot(entries)
+        self._written_clock = self._store.clock
+        logger.info(
+            f"Restored {len(entries)} threads from {self._path} in "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return len(entries)
+
+    def start(self) -> None:
+        if self._interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.snapshot()
+
+    async def snapshot(self) -> None:
+        """Capture the store on the event loop, then encode and write it off-loop."""
+        async with self._lock:
+            clock = self._store.clock
+            if clock == self._written_clock:
+                return
+            records = self._store.snapshot_records()
+            started = time.perf_counter()
+            count = await asyncio.to_thread(write_snapshot, self._path, records)
+            self._written_clock = clock
+            logger.info(
+                f"Snapshot of {count} threads written to {self._path} in "
+                f"{(time.perf_counter() - started) * 1000:.0f} ms"
+            )
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logger.warning(f"Periodic snapshot failed: {e}")
@@ -2,15 +2,29 @@
 
 from __future__ import annotations
 
+from typing import Awaitable, Callable
+
 from chatkit.agents import ThreadItemConverter
-from chatkit.types import HiddenContextItem
-from openai.types.responses import ResponseInputTextParam
+from chatkit.types import Attachment, HiddenContextItem
+from openai.types.responses import ResponseInputContentParam, ResponseInputTextParam
 from openai.types.responses.response_input_item_param import Message
 
+AttachmentContent = Callable[[Attachment], Awaitable[ResponseInputContentParam]]
+
 
 class BasicThreadItemConverter(ThreadItemConverter):
     """Adds HiddenContextItem support for the boilerplate demo."""
 
+    def __init__(self, attachment_content: AttachmentContent | None = None) -> None:
+        self._attachment_content = attachment_content
+
+    async def attachment_to_message_content(
+        self, attachment: Attachment
+    ) -> ResponseInputContentParam:
+        if self._attachment_content is None:
+            return await super().attachment_to_message_content(attachment)
+        return await self._attachment_content(attachment)
+
     async def hidden_context_to_input(self, item: HiddenContextItem):
         return Message(
             type="message",
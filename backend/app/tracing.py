@@ -0,0 +1,185 @@
+"""
+OpenTelemetry spans for the turn pipeline.
+
+Spans cover the HTTP request, store reads and writes, history conversion, every
+``Runner`` call and stream forwarding, tagged with the thread id, stage and token
+usage, so the critical path of a slow turn can be read off one trace.
+
+OpenTelemetry is optional (``pip install '.[tracing]'``). Spans are exported only
+when ``TRACING_EXPORTER`` names a registered exporter:
+
+- ``console``: spans printed to stdout
+- ``file``: one JSON span per line appended to ``TRACING_FILE``
+- ``otlp``: OTLP/HTTP, if ``opentelemetry-exporter-otlp-proto-http`` is installed
+- ``memory``: kept in memory (see ``memory_exporter``), for tests
+
+Other exporters can be added with ``register_exporter``. Without OpenTelemetry or an
+exporter, the helpers here are no-ops.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from contextlib import contextmanager
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        ConsoleSpanExporter,
+        SimpleSpanProcessor,
+        SpanExporter,
+    )
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+except ImportError:  # pragma: no cover - depends on the optional extra
+    trace = None  # type: ignore[assignment]
+
+ExporterFactory = Callable[[], "SpanExporter"]
+
+_exporters: dict[str, ExporterFactory] = {}
+_provider: TracerProvider | None = None
+memory_exporter: InMemorySpanExporter | None = None
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: dict[str, Any]) -> None:
+        pass
+
+    def is_recording(self) -> bool:
+        return False
+
+    def end(self) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def register_exporter(name: str, factory: ExporterFactory) -> None:
+    """Make ``factory()`` selectable with ``TRACING_EXPORTER=<name>``."""
+    _exporters[name] = factory
+
+
+def _file_exporter() -> SpanExporter:
+    out = open(os.getenv("TRACING_FILE", "traces.jsonl"), "a", buffering=1)
+    return ConsoleSpanExporter(out=out, formatter=lambda s: s.to_json(indent=None) + "\n")
+
+
+def _otlp_exporter() -> SpanExporter:
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+    return OTLPSpanExporter()
+
+
+def _memory_exporter() -> SpanExporter:
+    global memory_exporter
+    memory_exporter = InMemorySpanExporter()
+    return memory_exporter
+
+
+if trace is not None:
+    register_exporter("console", ConsoleSpanExporter)
+    register_exporter("file", _file_exporter)
+    register_exporter("otlp", _otlp_exporter)
+    register_exporter("memory", _memory_exporter)
+
+
+def configure_tracing(exporter: str | None = None) -> bool:
+    """Install a tracer provider exporting to ``exporter``; returns whether tracing is on."""
+    global _provider
+    name = exporter if exporter is not None else os.getenv("TRACING_EXPORTER", "")
+    if not name or _provider is not None:
+        return _provider is not None
+    if trace is None:
+        logger.warning(f"TRACING_EXPORTER={name} but OpenTelemetry is not installed")
+        return False
+    factory = _exporters.get(name)
+    if factory is None:
+        logger.warning(f"Unknown tracing exporter {name!r}; tracing disabled")
+        return False
+
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "dorthy-ai")})
+    )
+    # Export in a background thread, except in memory where tests read spans right away.
+    processor = SimpleSpanProcessor if name == "memory" else BatchSpanProcessor
+    _provider.add_span_processor(processor(factory()))
+    trace.set_tracer_provider(_provider)
+    logger.info(f"Tracing enabled with the {name} exporter")
+    return True
+
+
+def shutdown_tracing() -> None:
+    """Flush pending spans."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def _attributes(attributes: dict[str, Any]) -> dict[str, Any]:
+    return {f"dorthy.{key}": value for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Run the block in a child span of the current one; keyword args become attributes."""
+    if _provider is None:
+        yield _NOOP
+        return
+    tracer = trace.get_tracer(__name__)
+    with tracer.start_as_current_span(name, attributes=_attributes(attributes)) as current:
+        yield current
+
+
+def start_span(name: str, **attributes: Any) -> Any:
+    """Start a span the caller ends, for work that outlives the current block."""
+    if _provider is None:
+        return _NOOP
+    return trace.get_tracer(__name__).start_span(name, attributes=_attributes(attributes))
+
+
+@contextmanager
+def use_span(current: Any, end_on_exit: bool = False) -> Iterator[Any]:
+    """Make a span from ``start_span`` current for the block."""
+    if current is _NOOP:
+        yield current
+        return
+    with trace.use_span(current, end_on_exit=end_on_exit):
+        yield current
+
+
+def set_attributes(current: Any, **attributes: Any) -> None:
+    current.set_attributes(_attributes(attributes))
+
+
+def record_usage(current: Any, usage: Any) -> None:
+    """Tag a span with an agents ``Usage`` (token counts for the run)."""
+    if usage is None or not current.is_recording():
+        return
+    current.set_attributes(
+        {
+            "gen_ai.usage.input_tokens": usage.input_tokens,
+            "gen_ai.usage.output_tokens": usage.output_tokens,
+            "gen_ai.usage.total_tokens": usage.total_tokens,
+            "dorthy.model_requests": usage.requests,
+        }
+    )
+
+
+async def traced_stream(current: Any, source: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Forward a response stream inside ``current``, ending it when the stream ends.
+
+    Tasks started while the stream is consumed (the SSE pump running ``respond``)
+    inherit the span as their parent.
+    """
+    with use_span(current, end_on_exit=True):
+        async for chunk in source:
+            yield chunk
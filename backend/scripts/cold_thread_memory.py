@@ -0,0 +1,116 @@
+"""
+Measure resident memory of the in-memory store with hot vs. compressed idle threads.
+
+Each mode runs in a fresh interpreter so the numbers don't share an allocator:
+
+    uv run python scripts/cold_thread_memory.py --threads 10000 --items 12
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+_PAGE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _rss() -> int:
+    with open("/proc/self/statm") as fh:
+        return int(fh.read().split()[1]) * _PAGE
+
+
+async def _populate(threads: int, items: int, freeze: bool) -> dict[str, int]:
+    from chatkit.types import (
+        AssistantMessageContent,
+        AssistantMessageItem,
+        InferenceOptions,
+        ThreadMetadata,
+        UserMessageItem,
+        UserMessageTextContent,
+    )
+
+    from app.memory_store import MemoryStore
+
+    store = MemoryStore()
+    baseline = _rss()
+    created = datetime(2025, 1, 1)
+    for t in range(threads):
+        thread_id = f"thr_{t:06d}"
+        await store.save_thread(
+            ThreadMetadata(id=thread_id, created_at=created, title="First home in Ontario"), {}
+        )
+        for i in range(items):
+            at = created + timedelta(seconds=i)
+            if i % 2 == 0:
+                item = UserMessageItem(
+                    id=f"msg_{t}_{i}",
+                    thread_id=thread_id,
+                    created_at=at,
+                    content=[
+                        UserMessageTextContent(text=f"We earn about {60 + i}k and live in Peel.")
+                    ],
+                    attachments=[],
+                    inference_options=InferenceOptions(),
+                )
+            else:
+                item = AssistantMessageItem(
+                    id=f"msg_{t}_{i}",
+                    thread_id=thread_id,
+                    created_at=at,
+                    content=[
+                        AssistantMessageContent(
+                            text="Thanks! Is this your first home purchase anywhere in the world? "
+                            "Knowing that helps me check the land transfer tax refunds."
+                        )
+                    ],
+                )
+            await store.add_thread_item(thread_id, item, {})
+        # Freeze as the sweeper would in a long-running process, rather than all at the
+        # end, so the peak of fully hydrated threads isn't what gets measured.
+        if freeze and t % 100 == 99:
+            store.freeze_idle(0)
+    if freeze:
+        store.freeze_idle(0)
+    gc.collect()
+    return {"rss_bytes": _rss() - baseline, **store.residency()}
+
+
+def _run_mode(mode: str, threads: int, items: int) -> dict[str, int]:
+    output = subprocess.check_output(
+        [sys.executable, __file__, "--mode", mode, "--threads", str(threads), "--items", str(items)]
+    )
+    return json.loads(output)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=10_000)
+    parser.add_argument("--items", type=int, default=12)
+    parser.add_argument("--mode", choices=("hot", "cold"))
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(_populate(args.threads, args.items, args.mode == "cold"))))
+        return
+
+    per_10k = 10_000 / args.threads
+    results = {mode: _run_mode(mode, args.threads, args.items) for mode in ("hot", "cold")}
+    for mode, result in results.items():
+        print(
+            f"{mode:>4}: {result['rss_bytes'] * per_10k / 2**20:8.1f} MiB RSS per 10k threads "
+            f"({args.items} items each, {result['cold_bytes'] / 2**20:.1f} MiB of blobs)"
+        )
+    ratio = results["hot"]["rss_bytes"] / max(results["cold"]["rss_bytes"], 1)
+    print(f"cold threads use {ratio:.1f}x less memory")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Compare the routing call's output: full CompletnessCheckSchema JSON vs. ProfileDelta.
+
+Replays a scripted intake conversation turn by turn. By default it measures the JSON
+each contract makes the model emit (tokens via tiktoken when its encoding is
+available, otherwise a rough estimate) and estimates routing latency from it: a fixed
+time to first token plus the output decoded at --tokens-per-second. With --live it runs
+both contracts against the API and reports real output tokens and routing latency:
+
+    uv run python scripts/routing_output_tokens.py
+    uv run python scripts/routing_output_tokens.py --tokens-per-second 80 --first-token-ms 400
+    uv run python scripts/routing_output_tokens.py --live --repeats 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import time
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agents import Runner  # noqa: E402
+
+from app.dorthy_agent import (  # noqa: E402
+    CompletnessCheckSchema,
+    ProfileDelta,
+    compact_profile,
+    completeness_check,
+    expand_profile,
+)
+
+# (assistant question, user answer, fields the answer sets)
+TURNS: list[tuple[str, str, dict[str, Any]]] = [
+    ("Are you over 18 years of age?", "Yes, I'm 31.", {"age_18_plus": "yes"}),
+    (
+        "Are you a Canadian citizen or permanent resident?",
+        "Permanent resident since 2019.",
+        {"citizenship": "permanent resident"},
+    ),
+    (
+        "Have you or your partner ever owned a home in Canada?",
+        "Neither of us has ever owned.",
+        {"first_time": "never owned", "spouse_owned": "no"},
+    ),
+    (
+        "Where in Ontario are you planning to buy?",
+        "Somewhere in Brampton or Mississauga.",
+        {"city": "Brampton or Mississauga"},
+    ),
+    (
+        "Resale, new construction, or open to either?",
+        "Open to either really.",
+        {"property_type": "either"},
+    ),
+    ("When are you hoping to buy?", "Within the next year.", {"timeline": "6-12 months"}),
+    ("Will you move in within 9 months?", "Yes, we'd live there.", {"occupy_in_9_months": "yes"}),
+    (
+        "Do you or a close family member have DTC eligibility?",
+        "No.",
+        {"disability": "no"},
+    ),
+    ("Have you claimed a land transfer tax rebate before?", "Never.", {"prior_ltt_rebate": "no"}),
+    (
+        "What kind of home are you hoping for?",
+        "A townhouse with 3 bedrooms, parking is a must.",
+        {"home_type": "townhouse", "bedrooms": "3", "must_haves": "parking"},
+    ),
+    (
+        "What's been the hardest part so far?",
+        "Saving the down payment.",
+        {"pain_points": "saving for the down payment"},
+    ),
+    (
+        "How many people contribute to household income, and their jobs?",
+        "Two of us. I'm full-time for 4 years, my partner is on contract for 2.",
+        {
+            "earners": 2,
+            "c1_job": "full-time",
+            "c1_tenure": "3-5 years",
+            "c2_job": "contract",
+            "c2_tenure": "1-3 years",
+        },
+    ),
+    (
+        "Roughly what's your household income and credit score?",
+        "About 110K together, credit around 730.",
+        {"income": "$80-120K", "credit": "725-759"},
+    ),
+    (
+        "Monthly debts as a share of income, and down payment saved?",
+        "Maybe 15% on debts, and we have about 6% saved.",
+        {"debt": "10-30%", "down_payment": "5-10%"},
+    ),
+]
+
+
+def _counter() -> tuple[Callable[[str], int], str]:
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("o200k_base")
+        return (lambda text: len(encoding.encode(text))), "tokens"
+    except Exception:
+        # Roughly how BPE splits JSON: words, numbers and each punctuation mark.
+        pattern = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+        return (lambda text: len(pattern.findall(text))), "~tokens (estimate)"
+
+
+def offline(tokens_per_second: float, first_token_ms: float) -> None:
+    count, unit = _counter()
+    profile: CompletnessCheckSchema | None = None
+    full_total = delta_total = 0
+    latency: dict[str, list[float]] = {"full": [], "delta": []}
+    for turn, (_, _, fields) in enumerate(TURNS, start=1):
+        delta = ProfileDelta.model_validate(fields)
+        profile = expand_profile(profile, delta)
+        full = count(profile.model_dump_json())
+        compact = count(delta.model_dump_json(exclude_none=True))
+        full_total += full
+        delta_total += compact
+        latency["full"].append(first_token_ms + full / tokens_per_second * 1000)
+        latency["delta"].append(first_token_ms + compact / tokens_per_second * 1000)
+        print(f"turn {turn:2d}: full {full:4d}  delta {compact:3d}  {unit}")
+    assert profile is not None and profile.completed_info
+    print(
+        f"total: full {full_total}, delta {delta_total} {unit} "
+        f"({full_total / delta_total:.1f}x fewer output tokens)"
+    )
+    print(
+        f"estimated routing latency ({first_token_ms:.0f} ms to first token, "
+        f"{tokens_per_second:.0f} tokens/s):"
+    )
+    for name, samples in latency.items():
+        print(
+            f"{name:>5}: mean {statistics.mean(samples):5.0f} ms, "
+            f"max {max(samples):5.0f} ms per turn"
+        )
+
+
+def _conversation(turns: int) -> list[Any]:
+    items: list[Any] = []
+    for question, answer, _ in TURNS[:turns]:
+        items.append({"role": "assistant", "content": question})
+        items.append({"role": "user", "content": answer})
+    return items
+
+
+async def live(repeats: int) -> None:
+    legacy = completeness_check.clone(
+        output_type=CompletnessCheckSchema,
+        instructions=(
+            "Extract the home buyer's profile from the conversation. Leave unknown fields as "
+            '"". province is always "ON". Set completed_info to true only when every field '
+            "except contributors 2-4 and contact_permission is filled. Return the full JSON."
+        ),
+    )
+    results: dict[str, list[tuple[int, float]]] = {"full": [], "delta": []}
+    for _ in range(repeats):
+        profile: CompletnessCheckSchema | None = None
+        for turn in range(1, len(TURNS) + 1):
+            conversation = _conversation(turn)
+            started = time.perf_counter()
+            result = await Runner.run(legacy, conversation)
+            results["full"].append(
+                (result.context_wrapper.usage.output_tokens, time.perf_counter() - started)
+            )
+
+            known = f"Known profile: {compact_profile(profile)}"
+            baseline: Any = {"role": "developer", "content": known}
+            started = time.perf_counter()
+            result = await Runner.run(completeness_check, [*conversation, baseline])
+            results["delta"].append(
+                (result.context_wrapper.usage.output_tokens, time.perf_counter() - started)
+            )
+            profile = expand_profile(profile, result.final_output)
+
+    for name, samples in results.items():
+        tokens = [t for t, _ in samples]
+        latency = sorted(s for _, s in samples)
+        p95 = latency[min(len(latency) - 1, int(len(latency) * 0.95))]
+        print(
+            f"{name:>5}: {statistics.mean(tokens):6.1f} output tokens/turn, "
+            f"latency p50 {statistics.median(latency) * 1000:5.0f} ms, p95 {p95 * 1000:5.0f} ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--live", action="store_true", help="call the API (needs OPENAI_API_KEY)")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=80, help="decode rate for the estimate"
+    )
+    parser.add_argument(
+        "--first-token-ms", type=float, default=400, help="time to first token for the estimate"
+    )
+    args = parser.parse_args()
+    if args.live:
+        asyncio.run(live(args.repeats))
+    else:
+        offline(args.tokens_per_second, args.first_token_ms)
+
+
+if __name__ == "__main__":
+    main()
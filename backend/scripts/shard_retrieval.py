@@ -0,0 +1,123 @@
+"""
+Benchmark program retrieval from one global index vs. jurisdiction shards.
+
+Builds a synthetic corpus of federal, provincial and municipal program documents
+for a growing number of provinces, then times the same program lookups for an
+Ontario / Toronto buyer against a single index over everything and against the
+shard registry (which searches only ``ca``, ``on`` and ``on/toronto``):
+
+    uv run python scripts/shard_retrieval.py --provinces 1 4 13 --queries 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.program_shards import LocalIndexBackend, ShardRegistry  # noqa: E402
+
+PROVINCES = ("on", "bc", "ab", "qc", "mb", "sk", "ns", "nb", "nl", "pe", "yt", "nt", "nu")
+VOCABULARY = (
+    "rebate refund grant loan down payment first-time buyer land transfer tax resident "
+    "citizen income threshold household purchase price eligible apply closing occupy "
+    "months spouse owned application deadline maximum amount municipal provincial federal "
+    "savings account withdraw repay shared equity mortgage insured lender credit score"
+).split()
+PARAGRAPHS_PER_PROGRAM = 6
+
+
+def _program(rng: random.Random, name: str) -> str:
+    paragraphs = [f"# {name}"]
+    for _ in range(PARAGRAPHS_PER_PROGRAM):
+        words = rng.choices(VOCABULARY, k=60)
+        paragraphs.append(f"{name}: " + " ".join(words) + ".")
+    return "\n\n".join(paragraphs)
+
+
+def _write_corpus(root: Path, provinces: int, programs: int, municipalities: int) -> dict[str, str]:
+    """Write one directory per shard; returns the shard config for the registry."""
+    rng = random.Random(provinces)
+    shards = ["ca"]
+    for province in PROVINCES[:provinces]:
+        shards.append(province)
+        shards.extend(f"{province}/m{n}" for n in range(municipalities))
+    shards.append("on/toronto")
+    config: dict[str, str] = {}
+    for shard in shards:
+        directory = root / shard.replace("/", "_")
+        directory.mkdir(parents=True)
+        for n in range(programs):
+            name = f"{shard} program {n}"
+            (directory / f"{n}.md").write_text(_program(rng, name))
+        config[shard] = str(directory)
+    return config
+
+
+def _percentiles(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"p50 {statistics.median(ordered):6.2f} ms  p95 {p95:6.2f} ms"
+
+
+async def _bench(provinces: int, programs: int, municipalities: int, queries: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        config = _write_corpus(Path(tmp), provinces, programs, municipalities)
+        registry = ShardRegistry(config)
+        global_index = LocalIndexBackend(Path(tmp))
+
+        started = time.perf_counter()
+        global_index.load()
+        global_load = (time.perf_counter() - started) * 1000
+        paragraphs = global_index.size
+
+        shards = ["ca", "on", "on/toronto"]
+        lookups = [f"{random.choice(shards)} program {n % programs} rebate" for n in range(queries)]
+        # First search creates and indexes each shard's backend
+        started = time.perf_counter()
+        await registry.search(shards, lookups[0], 2)
+        shard_load = (time.perf_counter() - started) * 1000
+
+        global_ms: list[float] = []
+        sharded_ms: list[float] = []
+        for query in lookups:
+            started = time.perf_counter()
+            global_index.rank(query, 2)
+            global_ms.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            await registry.search(shards, query, 2)
+            sharded_ms.append((time.perf_counter() - started) * 1000)
+
+        print(
+            f"{provinces:2d} provinces, {len(config)} shards, {paragraphs} paragraphs "
+            f"(load: global {global_load:.0f} ms, matched shards {shard_load:.0f} ms)"
+        )
+        print(f"  global index   {_percentiles(global_ms)}")
+        print(f"  matched shards {_percentiles(sharded_ms)}")
+        for shard, stats in registry.stats()["shards"].items():
+            print(
+                f"    {shard:<12} avg {stats['avg_ms']:6.2f} ms over {stats['searches']} searches"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--provinces", type=int, nargs="+", default=[1, 4, 13])
+    parser.add_argument("--programs", type=int, default=40, help="programs per shard")
+    parser.add_argument("--municipalities", type=int, default=6, help="per province")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    for provinces in args.provinces:
+        asyncio.run(_bench(provinces, args.programs, args.municipalities, args.queries))
+
+
+if __name__ == "__main__":
+    main()
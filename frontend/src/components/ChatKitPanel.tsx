@@ -2,11 +2,14 @@ import { ChatKit, useChatKit } from "@openai/chatkit-react";
 import { useRef } from "react";
 
 import {
+  ATTACHMENTS,
   CHATKIT_API_DOMAIN_KEY,
   CHATKIT_API_URL,
   GREETING,
+  SESSION_HEADER,
   STARTER_PROMPTS,
   getPlaceholder,
+  getSessionId,
 } from "../lib/config";
 import { useAppStore } from "../store/useAppStore";
 
@@ -24,7 +27,16 @@ export function ChatKitPanel({ onChatKitReady }: ChatKitPanelProps) {
   const setThreadId = useAppStore((state) => state.setThreadId);
 
   const chatkit = useChatKit({
-    api: { url: CHATKIT_API_URL, domainKey: CHATKIT_API_DOMAIN_KEY },
+    api: {
+      url: CHATKIT_API_URL,
+      domainKey: CHATKIT_API_DOMAIN_KEY,
+      fetch: (input, init) => {
+        const headers = new Headers(init?.headers);
+        headers.set(SESSION_HEADER, getSessionId());
+        return fetch(input, { ...init, headers });
+      },
+      uploadStrategy: { type: "two_phase" },
+    },
     theme: {
       density: "spacious",
       colorScheme: "light",
@@ -47,6 +59,7 @@ export function ChatKitPanel({ onChatKitReady }: ChatKitPanelProps) {
     },
     composer: {
       placeholder: getPlaceholder(),
+      attachments: ATTACHMENTS,
     },
     threadItemActions: {
       feedback: false,
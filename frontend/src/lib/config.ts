@@ -14,6 +14,37 @@ export const CHATKIT_API_DOMAIN_KEY =
 
 export const THEME_STORAGE_KEY = "chatkit-boilerplate-theme";
 
+export const SESSION_STORAGE_KEY = "dorthy-session-id";
+export const SESSION_HEADER = "X-Dorthy-Session";
+
+/**
+ * Random per-browser id the backend uses to keep each visitor's threads separate.
+ */
+export const getSessionId = (): string => {
+  let sessionId = localStorage.getItem(SESSION_STORAGE_KEY);
+  if (!sessionId) {
+    sessionId = crypto.randomUUID();
+    localStorage.setItem(SESSION_STORAGE_KEY, sessionId);
+  }
+  return sessionId;
+};
+
+/**
+ * Text documents (e.g. a pre-approval letter) the assistant can read. The backend
+ * rejects files over ATTACHMENT_MAX_BYTES, so keep maxSize in step with it.
+ */
+export const ATTACHMENTS = {
+  enabled: true,
+  maxCount: 3,
+  maxSize: 10 * 1024 * 1024,
+  accept: {
+    "text/plain": [".txt"],
+    "text/markdown": [".md"],
+    "text/csv": [".csv"],
+    "application/json": [".json"],
+  },
+};
+
 export const GREETING = "Hi, I'm Dorthy — Your AI guide for first-time home buyers 🏡";
 
 export const MESSAGE = "I help you discover federal, provincial, and municipal housing programs you may qualify for. Everything is anonymous and confidential.";
@@ -13,6 +13,8 @@ export default defineConfig({
       "/chatkit": {
         target: backendTarget,
         changeOrigin: true,
+        // Forward X-Forwarded-For (plus this hop); the backend rate-limits by the client IP
+        xfwd: true,
       },
     },
     // For production deployments, add your public domains to this list
@@ -29,6 +31,8 @@ export default defineConfig({
       "/chatkit": {
         target: backendTarget,
         changeOrigin: true,
+        // Forward X-Forwarded-For (plus this hop); the backend rate-limits by the client IP
+        xfwd: true,
       },
     },
   },